@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Measure cold-start time of the conversion scripts.
+
+Every entry point in bin/ is run with --help in a fresh interpreter the given
+number of times. The bare import of the kmyimport package is measured as well
+so that the cost of the shared module can be told apart from the scripts.
+Finally a tiny Fio export in utf-8 is converted, as done when the scripts are
+called for many small files in a shell loop.
+"""
+
+import argparse
+import os
+import pathlib
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+BIN_DIR = ROOT / "bin"
+
+APP_DESC = 'Measure cold-start time of kmyimport entry points.'
+CONVERSION_LABEL = "fio2kmy.py tiny.csv"
+TINY_FIO_EXPORT = """\
+"accountId";"2100000000"
+"bankId";"2010"
+"currency";"CZK"
+"openingBalance";"1000,00"
+"closingBalance";"1100,00"
+"dateStart";"01.01.2017"
+"dateEnd";"31.01.2017"
+
+"ID pohybu";"Datum";"Objem";"Měna";"Protiúčet";"Název protiúčtu";\
+"Kód banky";"Název banky";"KS";"VS";"SS";"Poznámka";"Zpráva pro příjemce";\
+"Typ";"Provedl";"Upřesnění";"Komentář";"BIC";"ID pokynu"
+"1";"01/01/2017";"100,00";"CZK";"";"Shop";"";"";"";"";"";"note";"";"";"";\
+"";"";"";""
+"""
+
+
+def parse_args():
+    """Return parsed arguments of the script."""
+    parser = argparse.ArgumentParser(description=APP_DESC)
+    parser.add_argument(
+        '-n', '--runs',
+        type=int,
+        default=20,
+        help='Number of runs of each entry point.')
+    parser.add_argument(
+        'scripts',
+        nargs="*",
+        help='Names of scripts in bin/ to measure, or "{}" for the'
+        ' conversion. All of them by default.'.format(CONVERSION_LABEL))
+    return parser.parse_args()
+
+
+def get_entry_points(work_dir, names=None):
+    """Return list of (label, command) pairs to be measured.
+
+    Input of the conversion is written to the given directory.
+    """
+    result = [("import kmyimport",
+               [sys.executable, "-c", "import kmyimport"])]
+    for script in sorted(BIN_DIR.iterdir()):
+        if not script.is_file() or script.name.startswith(('.', '_')):
+            continue
+        if names and script.name not in names and script.stem not in names:
+            continue
+        result.append((script.name,
+                       [sys.executable, str(script), "--help"]))
+    if not names or CONVERSION_LABEL in names:
+        input_name = os.path.join(work_dir, "tiny.csv")
+        with open(input_name, "wt", encoding='utf-8') as handle:
+            handle.write(TINY_FIO_EXPORT)
+        result.append((CONVERSION_LABEL,
+                       [sys.executable, str(BIN_DIR / "fio2kmy.py"), "-q",
+                        input_name]))
+    return result
+
+
+def measure(command, runs):
+    """Return list of wall clock times in seconds of the given command."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in [str(ROOT), env.get("PYTHONPATH")] if p)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    # the scripts read text input in the encoding of locale
+    env["PYTHONUTF8"] = "1"
+    # the first run warms up the bytecode cache and is not accounted
+    subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    """Binds all the functionality together."""
+    args = parse_args()
+    print("{:<20}\t{:>8}\t{:>8}\t{:>8}".format(
+        "Entry point", "min[ms]", "median", "max"))
+    with tempfile.TemporaryDirectory() as work_dir:
+        for label, command in get_entry_points(work_dir, args.scripts):
+            times = [t * 1000 for t in measure(command, args.runs)]
+            print("{:<20}\t{:>8.1f}\t{:>8.1f}\t{:>8.1f}".format(
+                label, min(times), statistics.median(times), max(times)))
+
+
+if __name__ == '__main__':
+    main()
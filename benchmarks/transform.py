@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Measure throughput and allocations of the row transform.
+
+A Fio export with the given number of rows is generated into a temporary
+directory and converted with kmyimport.formats.fio.transform three times:
+
+throughput
+    rows per second of a plain run without tracing,
+streaming peak
+    peak of memory traced by tracemalloc while the output rows are consumed
+    one by one, as the scripts do,
+retained
+    bytes traced by tracemalloc and memory blocks allocated by the
+    interpreter per output row when all the rows are kept in a list.
+
+About a fifth of the rows have no payee so that the fallback column is merged,
+some of them have markup in the note.
+"""
+
+import argparse
+import csv
+import os
+import pathlib
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from kmyimport.formats import fio  # noqa: E402
+
+APP_DESC = 'Measure throughput and allocations of the Fio row transform.'
+HEADER = [
+    "ID pohybu", "Datum", "Objem", "Měna", "Protiúčet", "Název protiúčtu",
+    "Kód banky", "Název banky", "KS", "VS", "SS", "Poznámka",
+    "Zpráva pro příjemce", "Typ", "Provedl", "Upřesnění", "Komentář", "BIC",
+    "ID pokynu"]
+
+
+def parse_args():
+    """Return parsed arguments of the script."""
+    parser = argparse.ArgumentParser(description=APP_DESC)
+    parser.add_argument(
+        '-n', '--rows',
+        type=int,
+        default=1000000,
+        help='Number of rows of the generated export (default: %(default)s).')
+    return parser.parse_args()
+
+
+def write_export(file_name, count):
+    """Write Fio export with the given number of rows to the file."""
+    with open(file_name, "wt", encoding='utf-8', newline='') as handle:
+        writer = csv.writer(handle, delimiter=fio.INDELIM,
+                            quoting=csv.QUOTE_ALL)
+        writer.writerow(HEADER)
+        for index in range(count):
+            payee = "" if index % 5 == 0 else "{}/2010".format(
+                1000000 + index % 997)
+            note = ("<b>Card</b> payment &amp; fee" if index % 7 == 0
+                    else "Card payment {}".format(index % 101))
+            writer.writerow([
+                str(index), "{:02d}/{:02d}/2017".format(
+                    index % 28 + 1, index % 12 + 1),
+                "-{},{:02d}".format(index % 5000, index % 100), "CZK",
+                payee, "Account {}".format(index % 31), "2010",
+                "Fio banka", "0308", str(index % 10000), "", note,
+                "Receiver note", "Platba kartou", "", "", "my note", "", ""])
+
+
+def read_rows(file_name):
+    """Yields converted rows of the given export without the header."""
+    with open(file_name, "rt", encoding='utf-8', newline='') as handle:
+        rows = fio.transform(csv.reader(handle, delimiter=fio.INDELIM))
+        next(rows)
+        yield from rows
+
+
+def measure_throughput(file_name):
+    """Return the number of rows converted and seconds taken."""
+    count = 0
+    start = time.perf_counter()
+    for _ in read_rows(file_name):
+        count += 1
+    return count, time.perf_counter() - start
+
+
+def measure_streaming_peak(file_name):
+    """Return the peak of traced memory in bytes while streaming rows."""
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        for _ in read_rows(file_name):
+            pass
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+
+def measure_retained(file_name):
+    """Return bytes and blocks retained per row by the list of all rows."""
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        base_blocks = sys.getallocatedblocks()
+        rows = list(read_rows(file_name))
+        size = tracemalloc.get_traced_memory()[0] - base
+        blocks = sys.getallocatedblocks() - base_blocks
+        return size / len(rows), blocks / len(rows)
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    """Binds all the functionality together."""
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        file_name = os.path.join(work_dir, "export.csv")
+        write_export(file_name, args.rows)
+        count, seconds = measure_throughput(file_name)
+        print("rows                {:>12}".format(count))
+        print("time [s]            {:>12.2f}".format(seconds))
+        print("rows per second     {:>12.0f}".format(count / seconds))
+        print("streaming peak [kB] {:>12.1f}".format(
+            measure_streaming_peak(file_name) / 1024))
+        size, blocks = measure_retained(file_name)
+        print("retained B/row      {:>12.1f}".format(size))
+        print("retained blocks/row {:>12.2f}".format(blocks))
+
+
+if __name__ == '__main__':
+    main()
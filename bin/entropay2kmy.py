@@ -6,40 +6,16 @@ import-able by KMyMoney.
 
 import argparse
 import csv
-from datetime import datetime
-from enum import Enum
-import re
 
 import kmyimport
+import kmyimport.archive
+import kmyimport.fanout
+from kmyimport.formats import entropay
+import kmyimport.profiling
+import kmyimport.resilient
+import kmyimport.rules
 
 
-class EntropayColumns(Enum):
-    """Enumeration of interesting columns of input csv file."""
-    DATE = 0
-    PAYEE = 1
-    AMOUNT = 4
-    ORIGINALCURRENCY = 5
-    ORIGINALAMOUNT = 6
-    FOREXRATE = 7
-    FEECURRENCY = 8
-    FEEAMOUNT = 9
-    NETAMOUNT = 11
-
-
-INDELIM = ","
-PRIORITY_COLUMNS = (EntropayColumns.DATE.value,
-                    EntropayColumns.PAYEE.value,
-                    EntropayColumns.NETAMOUNT.value)
-MEMO_PRIORITY_COLUMNS = (EntropayColumns.ORIGINALCURRENCY.value,
-                         EntropayColumns.ORIGINALAMOUNT.value,
-                         EntropayColumns.FEECURRENCY.value,
-                         EntropayColumns.FEEAMOUNT.value)
-AMOUNT_COLUMNS = (EntropayColumns.AMOUNT.value,
-                  EntropayColumns.ORIGINALAMOUNT.value,
-                  EntropayColumns.FOREXRATE.value,
-                  EntropayColumns.FEEAMOUNT.value,
-                  EntropayColumns.NETAMOUNT.value)
-
 APP_DESC = 'Convert Entropay exports to csv file import-able by KMyMoney.'
 
 
@@ -51,71 +27,64 @@ def parse_args():
         type=argparse.FileType('r'),
         nargs="+",
         help='Files to process.')
-    return parser.parse_args()
-
-
-def is_column_amount(index):
-    """Returns true if the given index belongs to column containing amount."""
-    return index in AMOUNT_COLUMNS
-
-
-def merge_columns(row, original):
-    """Return row filled with data from alternative columns."""
-    for dest, src in []:
-        if row[dest]:
-            continue
-        data = kmyimport.data_sanitize(original[src], is_column_amount(src))
-        if not data:
-            continue
-        row = row[:dest] + [data] + row[dest + 1:]
-    return row
-
-
-def transform_date(value):
-    """Parse the given data value and return string expected by KMyMoney."""
-    # zero pad the day of month number
-    value = re.sub(r'^\d-', r'0\g<0>', value)
-    return datetime.strptime(value, "%d-%b-%Y").strftime("%d %m %Y")
-
-
-def transform(rows):
+    kmyimport.resilient.add_arguments(parser)
+    kmyimport.rules.add_arguments(parser)
+    kmyimport.fanout.add_arguments(parser)
+    kmyimport.archive.add_arguments(parser)
+    kmyimport.profiling.add_arguments(parser)
+    args = parser.parse_args()
+    if args.resilient and args.split_by:
+        parser.error("--split-by cannot be combined with --resilient")
+    return args
+
+
+def process_file(input_file, rules=None, split_by=None,
+                 max_open=kmyimport.fanout.DEFAULT_MAX_OPEN, archive=None,
+                 account=entropay.NAME):
+    """Writes a new file for the given csv file with .kmy.csv suffix.
+
+    With split_by, a file is written for each period instead. When archive is
+    given, the rows are stored there under the given account.
     """
-    Yields modified row for each input row.
-
-    Data is sanitized and less important columns are merged into single memo
-    column.
-    """
-    yield kmyimport.get_output_header()
-    for index, row in enumerate(rows):
-        newrow = []
-        for col in PRIORITY_COLUMNS:
-            data = kmyimport.data_sanitize(row[col], is_column_amount(col))
-            if index > 0 and col == EntropayColumns.DATE.value:
-                data = transform_date(data)
-            newrow.append(data)
-        if index == 0:
-            column_names = row
-            continue
-        newrow.append(kmyimport.get_memo_column(
-            column_names, row,
-            MEMO_PRIORITY_COLUMNS, PRIORITY_COLUMNS, is_column_amount))
-        yield merge_columns(newrow, row)
-
-
-def process_file(input_file):
-    """Writes a new file for the given csv file with .kmy.csv suffix."""
+    rows = csv.reader(input_file, delimiter=entropay.INDELIM, quotechar='"')
+    output = entropay.transform(rows)
+    if rules:
+        output = rules.transform(output)
+    if archive:
+        output = archive.watch(output, account, entropay.NAME,
+                               input_file.name)
+    if split_by:
+        kmyimport.fanout.write_split(output, input_file.name, split_by,
+                                     max_open)
+        return
     writer = kmyimport.get_csv_writer(input_file=input_file)
-    rows = csv.reader(input_file, delimiter=INDELIM, quotechar='"')
-    for row in transform(rows):
-        writer.writerow(row)
+    writer.writerows(output)
 
 
 # main is the main function
 def main():
     """Binds all the functionality together."""
     args = parse_args()
-    for input_file in args.files:
-        process_file(input_file)
+    rules = kmyimport.rules.load(args.rules) if args.rules else None
+    archive = None
+    if args.archive:
+        archive = kmyimport.archive.Archive(args.archive)
+    try:
+        with kmyimport.profiling.session(args, entropay):
+            for input_file in args.files:
+                if args.resilient:
+                    kmyimport.resilient.process_file(
+                        input_file, entropay.transform_row, entropay.INDELIM,
+                        checkpoint_every=args.checkpoint_every, rules=rules,
+                        archive=archive, account=args.account or entropay.NAME,
+                        source=entropay.NAME)
+                else:
+                    process_file(input_file, rules, args.split_by,
+                                 args.max_open, archive,
+                                 args.account or entropay.NAME)
+    finally:
+        if archive:
+            archive.close()
 
 
 if __name__ == '__main__':
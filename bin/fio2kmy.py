@@ -6,30 +6,15 @@ import-able by KMyMoney.
 
 import argparse
 import csv
-from enum import Enum
-import re
+import sys
 
 import kmyimport
-
-
-class FioColumns(Enum):
-    """Enumeration of interesting columns of input csv file."""
-    REFNUM = 0
-    DATE = 1
-    AMOUNT = 2
-    PAYEE = 4
-    PAYEEACCOUNTNAME = 5
-    NOTE = 11
-    RECEIVERNOTE = 12
-    MYNOTE = 16
-
-
-INDELIM = ";"
-PRIORITY_COLUMNS = (FioColumns.REFNUM.value, FioColumns.DATE.value,
-                    FioColumns.PAYEE.value, FioColumns.AMOUNT.value)
-MEMO_PRIORITY_COLUMNS = (FioColumns.MYNOTE.value, FioColumns.NOTE.value,
-                         FioColumns.RECEIVERNOTE.value)
-AMOUNT_COLUMNS = (FioColumns.AMOUNT.value, )
+import kmyimport.archive
+import kmyimport.fanout
+from kmyimport.formats import fio
+import kmyimport.profiling
+import kmyimport.resilient
+import kmyimport.rules
 
 
 def parse_args():
@@ -41,66 +26,77 @@ def parse_args():
         type=argparse.FileType('r'),
         nargs="+",
         help='Files to process.')
-    return parser.parse_args()
-
-
-def is_column_amount(index):
-    """Returns true if the given index belongs to column containing amount."""
-    return index in AMOUNT_COLUMNS
-
-
-def merge_columns(row, original):
-    """Return row filled with data from alternative columns."""
-    for dest, src in [(kmyimport.Columns.PAYEE,
-                       FioColumns.PAYEEACCOUNTNAME.value)]:
-        if row[dest]:
-            continue
-        data = kmyimport.data_sanitize(original[src], is_column_amount(src))
-        if not data:
-            continue
-        row = row[:dest] + [data] + row[dest + 1:]
-    return row
-
-
-def transform(rows):
-    """
-    Yields modified row for each input row.
-
-    Data is sanitized and less important columns are merged into single memo
-    column.
+    parser.add_argument(
+        '-q', '--quiet',
+        action='store_true',
+        help='Do not print the statement header.')
+    kmyimport.resilient.add_arguments(parser)
+    kmyimport.rules.add_arguments(parser)
+    kmyimport.fanout.add_arguments(parser)
+    kmyimport.archive.add_arguments(parser)
+    kmyimport.profiling.add_arguments(parser)
+    args = parser.parse_args()
+    if args.resilient and args.split_by:
+        parser.error("--split-by cannot be combined with --resilient")
+    return args
+
+
+def process_file(input_file, rules=None, split_by=None,
+                 max_open=kmyimport.fanout.DEFAULT_MAX_OPEN, verbose=True,
+                 archive=None, account=None):
+    """Writes a new file for the given csv file with .kmy.csv suffix.
+
+    With split_by, a file is written for each period instead. When archive is
+    given, the rows are stored there under the given account, the one from
+    the statement header by default. Returns the metadata of the statement.
     """
-    yield kmyimport.get_output_header()
-    for index, row in enumerate(rows):
-        newrow = []
-        for col in PRIORITY_COLUMNS:
-            data = kmyimport.data_sanitize(row[col], is_column_amount(col))
-            if index > 0 and col == FioColumns.DATE.value:
-                data = re.sub('/', ' ', data)
-            newrow.append(data)
-        if index == 0:
-            column_names = row
-            continue
-        newrow.append(kmyimport.get_memo_column(
-            column_names, row,
-            MEMO_PRIORITY_COLUMNS, PRIORITY_COLUMNS, is_column_amount))
-        yield merge_columns(newrow, row)
-
-
-def process_file(input_file):
-    """Writes a new file for the given csv file with .kmy.csv suffix."""
-    writer = kmyimport.get_csv_writer(input_file=input_file)
-    rows = csv.reader(input_file, delimiter=INDELIM, quotechar='"')
-    kmyimport.skip_header(rows)
-    for row in transform(rows):
-        writer.writerow(row)
+    rows = csv.reader(input_file, delimiter=fio.INDELIM, quotechar='"')
+    info = kmyimport.skip_header(rows, verbose)
+    balance = kmyimport.BalanceCheck.from_statement(info)
+    output = balance.watch(fio.transform(rows))
+    if rules:
+        output = rules.transform(output)
+    if archive:
+        output = archive.watch(output, account or info.account or fio.NAME,
+                               fio.NAME, input_file.name)
+    if split_by:
+        kmyimport.fanout.write_split(output, input_file.name, split_by,
+                                     max_open)
+    else:
+        writer = kmyimport.get_csv_writer(input_file=input_file)
+        writer.writerows(output)
+    error = balance.get_error()
+    if error:
+        print("{}: {}".format(input_file.name, error), file=sys.stderr)
+    return info
 
 
 # main is the main function
 def main():
     """Binds all the functionality together."""
     args = parse_args()
-    for input_file in args.files:
-        process_file(input_file)
+    rules = kmyimport.rules.load(args.rules) if args.rules else None
+    archive = None
+    if args.archive:
+        archive = kmyimport.archive.Archive(args.archive)
+    try:
+        with kmyimport.profiling.session(args, fio):
+            for input_file in args.files:
+                if args.resilient:
+                    kmyimport.resilient.process_file(
+                        input_file, fio.transform_row, fio.INDELIM,
+                        preamble=lambda rows: kmyimport.skip_header(
+                            rows, not args.quiet),
+                        checkpoint_every=args.checkpoint_every, rules=rules,
+                        archive=archive, account=args.account,
+                        source=fio.NAME)
+                else:
+                    process_file(input_file, rules, args.split_by,
+                                 args.max_open, not args.quiet, archive,
+                                 args.account)
+    finally:
+        if archive:
+            archive.close()
 
 
 if __name__ == '__main__':
@@ -6,86 +6,31 @@ import-able by KMyMoney.
 """
 
 import argparse
-from collections import defaultdict
 import csv
-from datetime import datetime
-from enum import IntEnum
-import pathlib
+import itertools
+import os
 
 import kmyimport
+import kmyimport.archive
+import kmyimport.fanout
+from kmyimport.formats import roklen
+import kmyimport.profiling
+import kmyimport.resilient
+import kmyimport.rules
 
 
-class TransColumns(IntEnum):
-    """Enumeration of columns of input transactions csv file."""
-    STATUS = 0
-    DATE = 1
-    REFNUM = 2
-    SOLD_AMOUNT = 3
-    SOLD_CURRENCY = 4
-    RATIO = 5
-    BOUGHT_AMOUNT = 6
-    BOUGHT_CURRENCY = 7
-    PAYEE = 8
-    AMOUNT = 9
-    VARIABLE_SYMBOL = 10
-    TYPE = 11
-
-
-class PayColumns(IntEnum):
-    """Enumeration of columns of payments csv file."""
-    DATE = 0
-    AMOUNT = 1
-    CURRENCY = 2
-    PAYEE = 3
-    REFNUM = 4
-    TRANSACTION_REFNUM = 5
-
-
-class DataColumns(IntEnum):
-    """Enumeration of internal data columns."""
-    REFNUM = 0
-    DATE = 1
-    PAYEE = 2
-    AMOUNT = 3
-    RATIO = 5
-    BOUGHT_AMOUNT = 6
-    BOUGHT_CURRENCY = 7
-    SOLD_CURRENCY = 8
-    VARIABLE_SYMBOL = 9
-    TYPE = 10
-    STATUS = 11
-    TRANSACTION_REFNUM = 12
-
-
-DATACOL_NAMES = {
-    DataColumns.RATIO: "Rate",
-    DataColumns.BOUGHT_AMOUNT: "Amount bought",
-    DataColumns.BOUGHT_CURRENCY: "Bought currency",
-    DataColumns.SOLD_CURRENCY: "Sold currency",
-    DataColumns.VARIABLE_SYMBOL: "Variable symbol",
-    DataColumns.TYPE: "Type",
-    DataColumns.STATUS: "Status",
-    DataColumns.TRANSACTION_REFNUM: "Reference number of transaction",
-}
-
-
-INDELIM = ";"
-PRIORITY_COLUMNS = (DataColumns.REFNUM, DataColumns.DATE,
-                    DataColumns.PAYEE, DataColumns.AMOUNT)
-MEMO_PRIORITY_COLUMNS = (DataColumns.BOUGHT_AMOUNT,
-                         DataColumns.BOUGHT_CURRENCY,
-                         DataColumns.SOLD_CURRENCY,
-                         DataColumns.RATIO, DataColumns.TRANSACTION_REFNUM)
-AMOUNT_COLUMNS = (DataColumns.AMOUNT, DataColumns.BOUGHT_AMOUNT)
-
 APP_DESC = """
 Convert RoklenFX exports to csv file import-able by KMyMoney.
 
 For each currency present in the given transactions or payments files an export
-file is created named RoklenFX-${date}-${currency}.kmy.csv. Each of such
-exported file should be imported in its own KMyMoney account of the same
-currency.
+file is created named RoklenFX-${date}-${currency}.kmy.csv where date is the
+date of the earliest transaction in the currency. Each of such exported file
+should be imported in its own KMyMoney account of the same currency. With
+--split-by month or year, a file is created for each currency and period
+instead, e.g. RoklenFX-2017-05-eur.kmy.csv. The rows keep the order of the
+input files, transactions first, payments then.
 """
+PARTIAL_SUFFIX = ".part"
 
 
 def parse_args():
@@ -99,147 +44,136 @@ def parse_args():
         'payments',
         type=argparse.FileType('rb'),
         help='Payments file.')
+    kmyimport.resilient.add_arguments(parser, checkpoint=False)
+    kmyimport.rules.add_arguments(parser)
+    kmyimport.fanout.add_arguments(
+        parser, ("currency",) + kmyimport.fanout.SPLIT_CHOICES, "currency")
+    kmyimport.archive.add_arguments(parser)
+    kmyimport.profiling.add_arguments(parser)
     return parser.parse_args()
 
 
-def is_column_amount(index):
-    """Returns true if the given index belongs to column containing amount."""
-    return index in AMOUNT_COLUMNS
+def get_file_name(currency, date, split_by="currency"):
+    """Return the name of output file for transactions of the given date.
 
+    Unless split by period, the date is expected to be the earliest one in
+    the currency.
+    """
+    if split_by == "month":
+        period = date.strftime("%Y-%m")
+    elif split_by == "year":
+        period = date.strftime("%Y")
+    else:
+        period = date.strftime("%Y-%m-%d")
+    return "RoklenFX-{}-{}.kmy.csv".format(period, currency)
 
-def transform(transactions):
-    """Yields rows for each transaction.
 
-    The data is sanitized (turned into strings).
-    """
-    yield kmyimport.get_output_header()
-    column_names = [
-        DATACOL_NAMES.get(c, "") for c in DataColumns.__members__.values()
-    ]
-    for transaction in transactions:
-        newrow = []
-        for col in PRIORITY_COLUMNS:
-            newrow.append(kmyimport.data_sanitize(transaction[col],
-                                                  is_column_amount(col)))
-        newrow.append(kmyimport.get_memo_column(
-            column_names, transaction,
-            MEMO_PRIORITY_COLUMNS, PRIORITY_COLUMNS, is_column_amount))
-        yield newrow
-
-
-def read_transactions(currencies, reader):
-    """Creates internal transactions for the given transactions input.
-
-    Parameters
-    ----------
-    currencies : dict(str -> list of dictionaries)
-                 The dictionary will be updated for new transactions.
-    reader : CSV reader for transactions file.
-    """
-    for index, row in enumerate(reader):
-        if index == 0:  # skip header
-            continue
-
-        sold_currency = row[TransColumns.SOLD_CURRENCY].lower()
-        transaction = {
-            DataColumns.REFNUM: row[TransColumns.REFNUM],
-            DataColumns.DATE: datetime.strptime(
-                row[TransColumns.DATE], '%Y/%m/%d'),
-            DataColumns.AMOUNT: "-" + row[TransColumns.SOLD_AMOUNT],
-            DataColumns.RATIO: row[TransColumns.RATIO],
-            DataColumns.BOUGHT_AMOUNT: row[TransColumns.BOUGHT_AMOUNT],
-            DataColumns.BOUGHT_CURRENCY: row[TransColumns.BOUGHT_CURRENCY],
-            DataColumns.STATUS: row[TransColumns.STATUS],
-        }
-
-        for attr in ["PAYEE", "VARIABLE_SYMBOL", "TYPE"]:
-            if row[TransColumns.__members__[attr]]:
-                transaction[DataColumns.__members__[attr]] = row[
-                    TransColumns.__members__[attr]]
-        currencies[sold_currency].append(transaction)
-
-        bought_currency = row[TransColumns.BOUGHT_CURRENCY].lower()
-        transaction = {
-            DataColumns.REFNUM: row[TransColumns.REFNUM],
-            DataColumns.DATE: datetime.strptime(
-                row[TransColumns.DATE], '%Y/%m/%d'),
-            DataColumns.AMOUNT: row[TransColumns.BOUGHT_AMOUNT],
-            DataColumns.SOLD_CURRENCY: row[TransColumns.SOLD_CURRENCY],
-            DataColumns.RATIO: row[TransColumns.RATIO],
-            DataColumns.STATUS: row[TransColumns.STATUS],
-        }
-
-        for attr in ["PAYEE", "VARIABLE_SYMBOL", "TYPE"]:
-            if row[TransColumns.__members__[attr]]:
-                transaction[DataColumns.__members__[attr]] = row[
-                    TransColumns.__members__[attr]]
-        currencies[bought_currency].append(transaction)
-
-
-def read_payments(currencies, reader):
-    """Creates internal transactions for the given payments input.
-
-    Parameters
-    ----------
-    currencies : dict(str -> list of dictionaries)
-                 The dictionary will be updated for new transactions made out
-                 of payments.
-    reader : CSV reader for payments file.
-    """
-    for index, row in enumerate(reader):
-        if index == 0:  # skip header
-            continue
-        currency = row[PayColumns.CURRENCY].lower()
-        transaction = {
-            DataColumns.REFNUM: row[PayColumns.REFNUM],
-            DataColumns.DATE: datetime.strptime(
-                row[PayColumns.DATE], '%d.%m.%Y'),
-            DataColumns.AMOUNT: "-" + row[PayColumns.AMOUNT],
-            DataColumns.PAYEE: row[PayColumns.PAYEE],
-            DataColumns.TRANSACTION_REFNUM:
-                row[PayColumns.TRANSACTION_REFNUM],
-        }
-        currencies[currency].append(transaction)
-
-
-def write_currency_file(currency, transactions):
-    """Writes a csv file for particular currency.
-
-    Parameters
-    ----------
-    currency : str
-               Abbreviation of currency.
-    transactions : list of dictionaries
-                   Contains transactions relating to the given currency.
-    """
-    transordered = sorted(transactions, key=lambda t: t[DataColumns.DATE])
-    pth = pathlib.PurePosixPath(
-        "RoklenFX-{}-{}.kmy.csv".format(
-            transordered[0][DataColumns.DATE].strftime("%Y-%m-%d"),
-            currency))
-    writer = kmyimport.get_csv_writer(str(pth))
-    for row in transform(transordered):
-        writer.writerow(row)
+def get_partial_file_name(currency):
+    """Return the name of file written until the earliest date is known."""
+    return "RoklenFX-{}.kmy.csv{}".format(currency, PARTIAL_SUFFIX)
 
 
-def process_files(transreader, payreader):
-    """Writes a new file for each currency in the given input readers."""
-    currencies = defaultdict(list)
-    read_transactions(currencies, transreader)
-    read_payments(currencies, payreader)
+def iter_numbered(input_name, pairs):
+    """Yields (origin, currency, transaction) for the given pairs.
 
-    for cur, trans in currencies.items():
-        write_currency_file(cur, trans)
+    The origin identifies the transaction in the archive, see
+    kmyimport.archive.get_origin.
+    """
+    for ordinal, (currency, transaction) in enumerate(pairs, 1):
+        yield (kmyimport.archive.get_origin(input_name, ordinal), currency,
+               transaction)
+
+
+def process_files(transreader, payreader, transquarantine=None,
+                  payquarantine=None, rules=None, split_by="currency",
+                  max_open=kmyimport.fanout.DEFAULT_MAX_OPEN, archive=None,
+                  account="RoklenFX",
+                  input_names=("transactions.csv", "payments.csv")):
+    """Writes a new file for each currency in the given input readers.
+
+    Rows are written as they are read, in order of the input. Unless split by
+    period, each currency is written to a partial file first, which is renamed
+    after the earliest transaction once all the input is converted. When
+    archive is given, the rows are stored there under account named after the
+    given one and the currency. The input_names are the names of the input
+    files of the readers. Returns names of the written files.
+    """
+    header = kmyimport.get_output_header()
+    if rules:
+        header = rules.get_output_header()
+    # currency -> date of the earliest transaction
+    earliest = {}
+    with kmyimport.fanout.FanOutWriter(header, max_open) as writer:
+        for origin, currency, transaction in itertools.chain(
+                iter_numbered(input_names[0], roklen.read_transactions(
+                    transreader, transquarantine)),
+                iter_numbered(input_names[1], roklen.read_payments(
+                    payreader, payquarantine))):
+            date = transaction[roklen.DataColumns.DATE]
+            if split_by != "currency":
+                file_name = get_file_name(currency, date, split_by)
+            else:
+                file_name = get_partial_file_name(currency)
+                if currency not in earliest or date < earliest[currency]:
+                    earliest[currency] = date
+            row = roklen.transform_row(transaction)
+            if rules:
+                row = rules.apply(row)
+            if archive:
+                archive.add("{}-{}".format(account, currency), roklen.NAME,
+                            row, origin)
+            writer.writerow(file_name, row)
+        file_names = writer.file_names
+    if archive:
+        archive.flush()
+    if split_by != "currency":
+        return file_names
+    file_names = []
+    for currency, date in earliest.items():
+        file_name = get_file_name(currency, date)
+        os.replace(get_partial_file_name(currency), file_name)
+        file_names.append(file_name)
+    return sorted(file_names)
+
+
+def get_quarantine(args, input_file):
+    """Return quarantine for the given input file in resilient mode."""
+    if not args.resilient:
+        return None
+    return kmyimport.resilient.Quarantine(kmyimport.get_output_file_name(
+        input_file.name, kmyimport.resilient.QUARANTINE_TAG))
 
 
 def main():
     """Binds all the functionality together."""
     args = parse_args()
     transreader = csv.reader(kmyimport.get_decoded(args.transactions),
-                             delimiter=INDELIM, quotechar='"')
+                             delimiter=roklen.INDELIM, quotechar='"')
     payreader = csv.reader(kmyimport.get_decoded(args.payments),
-                           delimiter=INDELIM, quotechar='"')
-    process_files(transreader, payreader)
+                           delimiter=roklen.INDELIM, quotechar='"')
+    quarantines = [get_quarantine(args, args.transactions),
+                   get_quarantine(args, args.payments)]
+    rules = kmyimport.rules.load(args.rules) if args.rules else None
+    archive = None
+    if args.archive:
+        archive = kmyimport.archive.Archive(args.archive)
+    try:
+        with kmyimport.profiling.session(args, roklen):
+            process_files(transreader, payreader, *quarantines, rules=rules,
+                          split_by=args.split_by, max_open=args.max_open,
+                          archive=archive, account=args.account or "RoklenFX",
+                          input_names=(args.transactions.name,
+                                       args.payments.name))
+    finally:
+        if archive:
+            archive.close()
+        for quarantine in quarantines:
+            if quarantine is None:
+                continue
+            quarantine.close()
+            if quarantine.count:
+                print("{} invalid rows written to {}".format(
+                    quarantine.count, quarantine.file_name))
 
 
 if __name__ == '__main__':
@@ -3,19 +3,16 @@ Script for conversion of csv export files from Fio Bank to csv that is
 import-able by KMyMoney.
 """
 
-import csv
-import codecs
 from datetime import datetime
+import functools
 import itertools
 from enum import IntEnum
-from html.parser import HTMLParser
-import pathlib
 import re
 
-import chardet
-
 OUTDELIM = ";"
 MEMO_SEP = " - "
+_PROBLEMATIC_CHARS = re.compile('[' + OUTDELIM + ',:]')
+_DAY_FIRST_DATE = re.compile(r'(\d{1,2})[./ -](\d{1,2})[./ -](\d{4})$')
 
 
 class Columns(IntEnum):
@@ -27,6 +24,8 @@ class Columns(IntEnum):
     MEMO = 4
 
 
+ROW_LENGTH = len(Columns)
+
 COLUMN_DESCRIPTIONS = {
     Columns.REFNUM: "Reference number",
     Columns.DATE: "Date",
@@ -35,23 +34,17 @@ COLUMN_DESCRIPTIONS = {
     Columns.MEMO: "Memo",
 }
 
-class MLStripper(HTMLParser):
-    def __init__(self):
-        super().__init__()
-        self.reset()
-        self.fed = []
-
-    def handle_data(self, d):
-        self.fed.append(d)
-
-    def get_data(self):
-        return ''.join(self.fed)
-
 
 def strip_tags(html):
-    stripper = MLStripper()
-    stripper.feed(html)
-    return stripper.get_data()
+    """Return the given text with html tags removed and entities resolved.
+
+    Most of the cells contain no markup at all, thus the html parser is loaded
+    and run only when there is something for it to do.
+    """
+    if '<' not in html and '&' not in html:
+        return html
+    from kmyimport.markup import strip_tags as _strip_tags
+    return _strip_tags(html)
 
 
 def get_output_header():
@@ -67,30 +60,47 @@ def data_sanitize(data, is_amount=False):
     appear in quoted strings as well.
     """
     if is_amount:
-        return re.sub(',', '.', data.strip())
+        return data.strip().replace(',', '.')
     if isinstance(data, datetime):
         return data.strftime('%d %m %Y')
-    return re.sub('[' + OUTDELIM + ',:]', '_', strip_tags(data.strip()))
+    return _PROBLEMATIC_CHARS.sub('_', strip_tags(data.strip()))
+
+
+@functools.lru_cache(maxsize=32)
+def _get_memo_order(names_count, row_length, priority_columns, skip_columns):
+    """Return indexes of columns making up memo in the order of appearance.
+
+    The order is the same for all rows of the same length in a file, thus it
+    is computed just once.
+    """
+    order = []
+    processed = set(skip_columns)
+    for index in itertools.chain(priority_columns, range(names_count)):
+        if index in processed or index >= row_length:
+            continue
+        processed.add(index)
+        order.append(index)
+    return tuple(order)
 
 
 def get_memo_column(column_names,
                     row,
-                    priority_columns=set(),
-                    skip_columns=set(),
+                    priority_columns=(),
+                    skip_columns=(),
                     is_column_amount=None):
     """Return the contents of memo column for the given row."""
+    if not isinstance(priority_columns, tuple):
+        priority_columns = tuple(priority_columns)
+    if not isinstance(skip_columns, (tuple, frozenset)):
+        skip_columns = frozenset(skip_columns)
     result = []
-    processed = set()
-    if not is_column_amount:
-        def is_column_amount(_):
-            return False
-    for index in itertools.chain(priority_columns, range(len(column_names))):
-        if index in skip_columns or index in processed or index >= len(row):
-            continue
-        processed.add(index)
+    for index in _get_memo_order(len(column_names), len(row),
+                                 priority_columns, skip_columns):
         name = column_names[index]
         try:
-            data = data_sanitize(row[index], is_column_amount(index))
+            data = data_sanitize(
+                row[index],
+                is_column_amount is not None and is_column_amount(index))
         except IndexError:
             print("failed on index={}, with row: {}".format(index, row))
             raise
@@ -98,8 +108,7 @@ def get_memo_column(column_names,
             continue
         if not data:
             continue
-        data = re.sub(OUTDELIM, '_', data)
-        result.append("{}{}{}".format(name, MEMO_SEP, data))
+        result.append(name + MEMO_SEP + data.replace(OUTDELIM, '_'))
     return "\n".join(result)
 
 
@@ -109,13 +118,28 @@ def get_decoded(infile, encoding=None):
     The infile will be closed and reopened again.
     """
     if not encoding:
+        import chardet
         raw = infile.read(32)
         encoding = chardet.detect(raw)['encoding']
     infile.close()
     return open(infile.name, "rt", encoding=encoding)
 
 
+def get_output_file_name(input_name, tag=".kmy"):
+    """Return the name of output file derived from the given input file name.
+
+    The tag is inserted in front of the suffix, e.g. ``export.csv`` becomes
+    ``export.kmy.csv``.
+    """
+    import pathlib
+    pth = pathlib.PurePosixPath(input_name)
+    return str(pathlib.PurePath.joinpath(
+        pth.parent, pth.stem + tag + pth.suffix))
+
+
 def get_csv_writer(output_file=None, input_file=None):
+    import csv
+
     def get_writer(handle):
         return csv.writer(handle, delimiter=OUTDELIM, quoting=csv.QUOTE_ALL)
 
@@ -124,23 +148,201 @@ def get_csv_writer(output_file=None, input_file=None):
     elif output_file and hasattr(output_file, "write"):
         return csv.writer(output_file)
     elif input_file:
-        pth = pathlib.PurePosixPath(input_file.name)
-        file_name = pathlib.PurePath.joinpath(
-            pth.parent, pth.stem + ".kmy" + pth.suffix)
+        file_name = get_output_file_name(input_file.name)
         return get_writer(open(file_name, "w", encoding='utf-16'))
 
     raise TypeError("no supported output_file or input_file given")
 
 
-def skip_header(rows):
-    """Print and skip the header preceding the actual data."""
-    for row in rows:
-        if len(row) <= 2:
-            if len(row) == 2:
-                print("{:<15}\t{}".format(
-                    row[0].strip().strip('"').capitalize() + ":",
-                    row[1].strip()))
-            else:
-                return
+def parse_decimal(value):
+    """Return decimal number parsed from the given amount or None if empty.
+
+    Both decimal comma and point are accepted, whitespace is ignored. Raises
+    ValueError when the value is not a number.
+    """
+    from decimal import Decimal, InvalidOperation
+    value = re.sub(r'\s', '', value).replace(',', '.')
+    if not value:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError("invalid amount: {!r}".format(value)) from None
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_date(value):
+    """Return the given day first date in the form DD MM YYYY.
+
+    Day, month and year may be separated by dots, slashes, dashes or spaces.
+    Raises ValueError when the value is not a valid date, so that every
+    output row has the date in the same shape. Exports repeat the same dates
+    a lot, thus the results are cached.
+    """
+    match = _DAY_FIRST_DATE.match(value)
+    if match is not None:
+        day, month, year = (int(part) for part in match.groups())
+        try:
+            datetime(year, month, day)
+        except ValueError:
+            pass
         else:
+            return "{:02d} {:02d} {:04d}".format(day, month, year)
+    raise ValueError("invalid date: {!r}".format(value))
+
+
+class StatementInfo:
+    """Metadata of bank statement read from the header preceding the data.
+
+    All the fields are available in ``fields`` dictionary under the names
+    used in the header. The interesting ones are parsed by the properties.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = dict(fields or {})
+
+    def get(self, name, default=None):
+        """Return the raw value of the given header field."""
+        return self.fields.get(name, default)
+
+    def _get_decimal(self, name):
+        value = self.get(name)
+        if not value:
+            return None
+        try:
+            return parse_decimal(value)
+        except ValueError:
+            return None
+
+    def _get_date(self, name):
+        value = self.get(name)
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, "%d.%m.%Y").date()
+        except ValueError:
+            return None
+
+    @property
+    def account(self):
+        account = self.get("accountId")
+        if account and self.get("bankId"):
+            return "{}/{}".format(account, self.get("bankId"))
+        return account
+
+    @property
+    def currency(self):
+        return self.get("currency")
+
+    @property
+    def opening_balance(self):
+        return self._get_decimal("openingBalance")
+
+    @property
+    def closing_balance(self):
+        return self._get_decimal("closingBalance")
+
+    @property
+    def date_start(self):
+        return self._get_date("dateStart")
+
+    @property
+    def date_end(self):
+        return self._get_date("dateEnd")
+
+    def __bool__(self):
+        return bool(self.fields)
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, self.fields)
+
+
+def skip_header(rows, verbose=True):
+    """Skip the header preceding the actual data and return its contents.
+
+    The returned StatementInfo holds the fields found in the header. They are
+    also printed unless verbose is False.
+    """
+    fields = {}
+    for row in rows:
+        if len(row) != 2:
+            break
+        name = row[0].strip().strip('"')
+        fields[name] = row[1].strip()
+        if verbose:
+            print("{:<15}\t{}".format(name.capitalize() + ":", fields[name]))
+    return StatementInfo(fields)
+
+
+class BalanceCheck:
+    """Verifies that amounts of transactions add up to the stated balances.
+
+    Amounts are summed up while the output rows stream through ``watch``. The
+    result is available once all the rows are consumed.
+    """
+
+    def __init__(self, opening_balance, closing_balance):
+        self.opening_balance = opening_balance
+        self.closing_balance = closing_balance
+        self.total = 0
+        self.count = 0
+        self.invalid = 0
+
+    @classmethod
+    def from_statement(cls, info):
+        return cls(info.opening_balance, info.closing_balance)
+
+    @property
+    def enabled(self):
+        return (self.opening_balance is not None
+                and self.closing_balance is not None)
+
+    @property
+    def balance(self):
+        """Return the running balance."""
+        return (self.opening_balance or 0) + self.total
+
+    def add(self, amount):
+        """Account for the given amount of transaction."""
+        self.count += 1
+        try:
+            amount = parse_decimal(amount)
+        except ValueError:
+            self.invalid += 1
             return
+        if amount is not None:
+            self.total += amount
+
+    def watch(self, rows):
+        """Yields the given output rows accounting for their amounts.
+
+        The first row is expected to be the header.
+        """
+        for index, row in enumerate(rows):
+            if index > 0 and self.enabled:
+                self.add(row[Columns.AMOUNT])
+            yield row
+
+    def get_error(self):
+        """Return description of mismatch or None if the balances agree."""
+        if not self.enabled or self.balance == self.closing_balance:
+            return None
+        error = ("balance mismatch: opening balance {} with {} transactions "
+                 "totalling {} gives {}, but the statement states closing "
+                 "balance {} (difference {}); the export may be truncated"
+                 .format(self.opening_balance, self.count, self.total,
+                         self.balance, self.closing_balance,
+                         self.closing_balance - self.balance))
+        if self.invalid:
+            error += " or {} invalid amounts were skipped".format(self.invalid)
+        return error
+
+
+def iter_transactions(source, format, encoding=None):
+    """Yields transactions read from the given source in the given format.
+
+    The transactions are kmyimport.transactions.Transaction objects. See
+    kmyimport.transactions.iter_transactions for details.
+    """
+    from kmyimport.transactions import iter_transactions as _iter
+    return _iter(source, format, encoding)
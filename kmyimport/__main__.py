@@ -0,0 +1,6 @@
+"""Run the kmyimport command."""
+
+import kmyimport.command
+
+if __name__ == '__main__':
+    kmyimport.command.main()
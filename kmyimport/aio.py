@@ -0,0 +1,272 @@
+"""
+Asynchronous conversion of many exports at once.
+
+Intended for applications built on asyncio that need to convert a bulk of
+files without blocking their event loop::
+
+    async def convert_all(names):
+        converter = kmyimport.aio.BatchConverter(max_concurrency=4)
+        try:
+            return await converter.convert_many(
+                [kmyimport.aio.Job(name, "fio") for name in names],
+                progress=lambda job: print(job.source, job.rows))
+        finally:
+            converter.close()
+
+Each job reads and converts its input in batches of rows on the shared
+executor of the converter while the previous batch is written to the output
+file on a second executor owned by the converter, so the loop itself never
+waits for disk or for the transform. At most max_concurrency jobs run at once,
+the others wait for a free slot. A job is cancelled by cancelling its task;
+the task finishes once no worker uses the files of the job any more and its
+unfinished output file is removed.
+
+Every job writes a single output file, thus formats yielding rows in several
+currencies, see kmyimport.formats.MULTI_CURRENCY_FORMATS, are not supported.
+Convert them with roklen2kmy.py, which writes a file per currency.
+
+The executor has to be thread based as the jobs keep their readers between
+the batches.
+"""
+
+import asyncio
+import concurrent.futures
+import csv
+import io
+import itertools
+import os
+
+import kmyimport
+import kmyimport.formats
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_CONCURRENCY = 4
+# Python 3.6 has no get_running_loop
+_get_running_loop = getattr(asyncio, "get_running_loop",
+                            asyncio.get_event_loop)
+
+
+class Job:
+    """Conversion of single input file.
+
+    The counters are updated as the conversion proceeds and can be inspected
+    by progress callbacks.
+
+    Parameters
+    ----------
+    source : str
+             Path of the input file.
+    format : str
+             One of kmyimport.formats.FORMATS except for
+             kmyimport.formats.MULTI_CURRENCY_FORMATS.
+    output : str
+             Path of the output file. Derived from the source when not given.
+    encoding : str
+               Encoding of the input. Each format has its own default.
+    """
+
+    def __init__(self, source, format, output=None, encoding=None):
+        kmyimport.formats.get_format(format)
+        if format in kmyimport.formats.MULTI_CURRENCY_FORMATS:
+            raise ValueError(
+                "format {!r} yields rows in several currencies, which cannot"
+                " be written to a single output".format(format))
+        self.source = source
+        self.format = format
+        self.output = output or kmyimport.get_output_file_name(source)
+        self.encoding = encoding
+        self.rows = 0
+        self.bytes_read = 0
+        self.size = None
+        self.done = False
+
+    @property
+    def fraction(self):
+        """Return the part of input read so far between 0 and 1."""
+        if self.done:
+            return 1.0
+        if not self.size:
+            return 0.0
+        return min(self.bytes_read / self.size, 1.0)
+
+    def __repr__(self):
+        return "Job({!r}, {!r}, rows={})".format(
+            self.source, self.format, self.rows)
+
+
+def _read_batch(rows, raw, batch_size):
+    """Return the next batch of output rows and the input offset reached."""
+    return list(itertools.islice(rows, batch_size)), raw.tell()
+
+
+def _output_rows(rows, rules):
+    for _, row in rows:
+        yield rules.apply(row) if rules else row
+
+
+async def _wait_for_workers(futures):
+    """Wait until none of the given concurrent futures runs any more.
+
+    Futures not started yet are cancelled. When the waiting task is cancelled,
+    it keeps waiting and raises CancelledError once the workers are finished.
+    """
+    running = [f for f in futures if not f.cancel() and not f.done()]
+    if not running:
+        return
+    waiting = asyncio.ensure_future(
+        asyncio.wait([asyncio.wrap_future(f) for f in running]))
+    cancelled = False
+    while not waiting.done():
+        try:
+            await asyncio.shield(waiting)
+        except asyncio.CancelledError:
+            # the files must not be closed under the workers
+            cancelled = True
+    if cancelled:
+        raise asyncio.CancelledError()
+
+
+class BatchConverter:
+    """Runs conversion jobs concurrently on a shared executor.
+
+    Parameters
+    ----------
+    max_concurrency : int
+                      Maximum number of jobs converted at once.
+    executor : concurrent.futures.ThreadPoolExecutor
+               Executor running the transforms. A private one with
+               max_concurrency workers is created when not given.
+    batch_size : int
+                 Number of rows read, converted and written at once.
+    rules : kmyimport.rules.RuleSet
+            Rules normalizing the output rows.
+    """
+
+    def __init__(self,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 executor=None,
+                 batch_size=DEFAULT_BATCH_SIZE,
+                 rules=None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be positive")
+        if batch_size < 1:
+            raise ValueError("batch_size must be positive")
+        self._own_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_concurrency)
+        self.executor = executor
+        # opens the files and writes the output
+        self._io_executor = concurrent.futures.ThreadPoolExecutor(
+            max_concurrency)
+        self.batch_size = batch_size
+        self.rules = rules
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    def _get_semaphore(self):
+        # created lazily to bind to the loop running the jobs
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def close(self):
+        """Shut down the executors except for the one given by the caller."""
+        self._io_executor.shutdown()
+        if self._own_executor:
+            self.executor.shutdown()
+
+    def submit(self, job, progress=None):
+        """Schedule the given job and return its task.
+
+        Cancel the task to cancel the job.
+        """
+        return asyncio.ensure_future(self.convert(job, progress))
+
+    async def convert_many(self, jobs, progress=None,
+                           return_exceptions=False):
+        """Convert all the given jobs and return them in the same order.
+
+        When return_exceptions is true, a failed job is replaced by its
+        exception in the result instead of cancelling the others.
+        """
+        tasks = [self.submit(job, progress) for job in jobs]
+        try:
+            return await asyncio.gather(
+                *tasks, return_exceptions=return_exceptions)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    async def convert(self, job, progress=None):
+        """Convert the given job once a slot is free and return it.
+
+        Parameters
+        ----------
+        job : Job
+        progress : function(job)
+                   Called after each batch converted and when the job is done.
+        """
+        async with self._get_semaphore():
+            return await self._convert(job, progress)
+
+    async def _convert(self, job, progress):
+        loop = _get_running_loop()
+        reader, default_encoding = kmyimport.formats.get_reader(job.format)
+        header = kmyimport.get_output_header()
+        if self.rules:
+            header = self.rules.get_output_header()
+        # futures of all the work submitted, the files must not be closed
+        # while any of them runs
+        futures = []
+        # files opened by the workers
+        files = {}
+
+        def run(executor, function, *args):
+            future = executor.submit(function, *args)
+            futures.append(future)
+            return asyncio.shield(asyncio.wrap_future(future, loop=loop))
+
+        def open_file(key, *args, **kwargs):
+            files[key] = open(*args, **kwargs)
+            return files[key]
+
+        try:
+            raw = await run(self._io_executor, open_file, "raw", job.source,
+                            "rb")
+            job.size = os.fstat(raw.fileno()).st_size
+            handle = io.TextIOWrapper(
+                raw, encoding=job.encoding or default_encoding, newline='')
+            rows = _output_rows(reader(handle), self.rules)
+            output = await run(
+                self._io_executor,
+                lambda: open_file("output", job.output, "w",
+                                  encoding='utf-16'))
+            writer = csv.writer(output, delimiter=kmyimport.OUTDELIM,
+                                quoting=csv.QUOTE_ALL)
+            writing = run(self._io_executor, writer.writerow, header)
+            while True:
+                batch, job.bytes_read = await run(
+                    self.executor, _read_batch, rows, raw, self.batch_size)
+                await writing
+                if not batch:
+                    break
+                writing = run(self._io_executor, writer.writerows, batch)
+                job.rows += len(batch)
+                if progress:
+                    progress(job)
+        except BaseException:
+            try:
+                await _wait_for_workers(futures)
+            finally:
+                if "output" in files:
+                    files.pop("output").close()
+                    os.remove(job.output)
+            raise
+        finally:
+            for opened in files.values():
+                opened.close()
+        job.done = True
+        if progress:
+            progress(job)
+        return job
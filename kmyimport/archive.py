@@ -0,0 +1,249 @@
+"""
+Local archive of converted transactions.
+
+Converters write the rows they produce to an SQLite database indexed by date,
+account and reference number. Any date range or subset of accounts can later
+be exported to csv import-able by KMyMoney without parsing the original
+exports again.
+
+Each transaction is stored only once. Transactions are identified by account,
+reference number, date and amount. Transactions without reference number are
+identified by all their fields except category together with their origin,
+the name of input file and the ordinal number of the row in it, so that
+identical purchases made on the same day are kept apart. A transaction
+archived again, e.g. when the same export is converted twice with different
+rules, replaces the stored one.
+"""
+
+import datetime
+import itertools
+import os
+
+import kmyimport
+
+BATCH_SIZE = 1000
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    source TEXT NOT NULL,
+    account TEXT NOT NULL,
+    refnum TEXT NOT NULL,
+    date TEXT NOT NULL,
+    payee TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    memo TEXT NOT NULL,
+    category TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date);
+CREATE INDEX IF NOT EXISTS transactions_account
+    ON transactions (account, date);
+CREATE INDEX IF NOT EXISTS transactions_refnum ON transactions (refnum);
+"""
+INSERT = """
+INSERT OR REPLACE INTO transactions
+    (digest, source, account, refnum, date, payee, amount, memo, category)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def add_arguments(parser):
+    """Add options controlling the archive to the given parser."""
+    parser.add_argument(
+        '--archive',
+        metavar='DB',
+        help='Store converted transactions also in the given archive.')
+    parser.add_argument(
+        '--account',
+        help='Name of account the transactions are archived under.')
+
+
+def get_origin(file_name, ordinal):
+    """Return origin of the row with the given ordinal number in the file.
+
+    Only the base name of the file is used, so that the same export stored
+    in different directories gets the same origin.
+    """
+    return "{}:{}".format(os.path.basename(file_name), ordinal)
+
+
+def _parse_date(parts, value, expected):
+    """Return date made of (year, month, day) parts of the given value."""
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        raise ValueError("invalid date {!r}, expected {}".format(
+            value, expected))
+    try:
+        return datetime.date(*map(int, parts))
+    except ValueError as err:
+        raise ValueError("invalid date {!r}: {}".format(value, err)) \
+            from None
+
+
+def to_iso_date(date):
+    """Return the given output date (day month year) in ISO format.
+
+    Raises ValueError when the date is not a valid one in the output format,
+    as such dates could not be compared.
+    """
+    return _parse_date(date.split()[::-1], date, "DD MM YYYY").isoformat()
+
+
+def from_iso_date(date):
+    """Return the given ISO date in the format of output rows.
+
+    Raises ValueError when the date is not a valid ISO date.
+    """
+    return _parse_date(date.split("-"), date, "YYYY-MM-DD").strftime(
+        "%d %m %Y")
+
+
+class Archive:
+    """Archive of transactions backed by SQLite database."""
+
+    def __init__(self, file_name, batch_size=BATCH_SIZE):
+        import hashlib
+        import sqlite3
+        self._sha1 = hashlib.sha1
+        self.connection = sqlite3.connect(file_name)
+        self.connection.executescript(SCHEMA)
+        self.batch_size = batch_size
+        self._batch = []
+
+    def add(self, account, source, row, origin=""):
+        """Store the given output row in the archive.
+
+        The origin, see get_origin, identifies rows without reference number.
+        Rows are written in batches, call flush to write the pending ones.
+        Raises ValueError for row with invalid date, which is not stored.
+        """
+        cols = kmyimport.Columns
+        try:
+            date = to_iso_date(row[cols.DATE])
+        except ValueError as err:
+            raise ValueError("cannot archive row {}: {}".format(row, err)) \
+                from None
+        record = [source, account, row[cols.REFNUM], date, row[cols.PAYEE],
+                  row[cols.AMOUNT], row[cols.MEMO],
+                  row[len(cols)] if len(row) > len(cols) else ""]
+        if record[2]:
+            # account, refnum, date and amount
+            identity = record[1:4] + record[5:6]
+        else:
+            identity = record[1:7] + [origin]
+        digest = self._sha1(
+            "\0".join(identity).encode('utf-8')).hexdigest()
+        self._batch.append([digest] + record)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def watch(self, rows, account, source, file_name):
+        """Yields the given output rows storing them in the archive.
+
+        The rows are converted from input file of the given name. The first
+        row is expected to be the header.
+        """
+        for index, row in enumerate(rows):
+            if index > 0:
+                self.add(account, source, row, get_origin(file_name, index))
+            yield row
+        self.flush()
+
+    def wrap(self, transform_row, account, source, file_name, start=0):
+        """Return transform_row function storing its result in the archive.
+
+        The function is expected to be called for each data row of input file
+        of the given name, beginning with the row following start rows.
+        """
+        ordinals = itertools.count(start + 1)
+
+        def wrapper(column_names, row):
+            # rows failing to convert are numbered as well
+            origin = get_origin(file_name, next(ordinals))
+            newrow = transform_row(column_names, row)
+            self.add(account, source, newrow, origin)
+            return newrow
+        return wrapper
+
+    def flush(self):
+        """Write pending rows to the database."""
+        if self._batch:
+            with self.connection:
+                self.connection.executemany(INSERT, self._batch)
+            self._batch = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _where(self, date_from=None, date_to=None, accounts=None):
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append("date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("date <= ?")
+            params.append(date_to)
+        if accounts:
+            conditions.append("account IN ({})".format(
+                ", ".join("?" * len(accounts))))
+            params.extend(accounts)
+        if not conditions:
+            return "", params
+        return " WHERE " + " AND ".join(conditions), params
+
+    def has_categories(self, date_from=None, date_to=None, accounts=None):
+        """Return true if any of selected transactions has a category."""
+        where, params = self._where(date_from, date_to, accounts)
+        where += (" AND " if where else " WHERE ") + "category != ''"
+        cursor = self.connection.execute(
+            "SELECT EXISTS (SELECT 1 FROM transactions" + where + ")", params)
+        return bool(cursor.fetchone()[0])
+
+    def select(self, date_from=None, date_to=None, accounts=None,
+               with_category=False):
+        """Yields output rows of archived transactions ordered by date.
+
+        Dates are inclusive and given in ISO format.
+        """
+        where, params = self._where(date_from, date_to, accounts)
+        cursor = self.connection.execute(
+            "SELECT refnum, date, payee, amount, memo, category"
+            " FROM transactions" + where + " ORDER BY date, id", params)
+        for row in cursor:
+            row = list(row)
+            row[kmyimport.Columns.DATE] = from_iso_date(
+                row[kmyimport.Columns.DATE])
+            yield row if with_category else row[:-1]
+
+    def accounts(self):
+        """Return list of (account, count, first date, last date) tuples."""
+        return self.connection.execute(
+            "SELECT account, COUNT(*), MIN(date), MAX(date)"
+            " FROM transactions GROUP BY account ORDER BY account").fetchall()
+
+
+def export(archive, output_file, date_from=None, date_to=None, accounts=None):
+    """Write selected transactions of the archive to the given file.
+
+    The output is import-able by KMyMoney. Returns the number of written
+    transactions.
+    """
+    import kmyimport.rules
+    with_category = archive.has_categories(date_from, date_to, accounts)
+    header = kmyimport.get_output_header()
+    if with_category:
+        header.append(kmyimport.rules.CATEGORY_HEADER)
+    writer = kmyimport.get_csv_writer(output_file)
+    writer.writerow(header)
+    count = 0
+    for row in archive.select(date_from, date_to, accounts, with_category):
+        writer.writerow(row)
+        count += 1
+    return count
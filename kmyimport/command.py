@@ -0,0 +1,76 @@
+"""
+Command line interface working with the archive of converted transactions.
+"""
+
+import argparse
+from datetime import datetime
+
+import kmyimport.archive
+
+APP_DESC = 'Work with archive of transactions converted for KMyMoney.'
+
+
+def iso_date(value):
+    """Return the given date validated to be in ISO format."""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "invalid date {!r}, expected YYYY-MM-DD".format(value))
+
+
+def parse_args(argv=None):
+    """Return parsed arguments of the command."""
+    parser = argparse.ArgumentParser(prog='kmyimport', description=APP_DESC)
+    parser.add_argument(
+        '--archive',
+        metavar='DB',
+        required=True,
+        help='Archive of transactions.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    export = subparsers.add_parser(
+        'export',
+        help='Write archived transactions to csv import-able by KMyMoney.')
+    export.add_argument(
+        '--from',
+        dest='date_from',
+        type=iso_date,
+        metavar='YYYY-MM-DD',
+        help='Export transactions since the given date.')
+    export.add_argument(
+        '--to',
+        dest='date_to',
+        type=iso_date,
+        metavar='YYYY-MM-DD',
+        help='Export transactions until the given date (inclusive).')
+    export.add_argument(
+        '--account',
+        dest='accounts',
+        action='append',
+        help='Export transactions of the given account. May be repeated.')
+    export.add_argument(
+        '-o', '--output',
+        default='export.kmy.csv',
+        help='Output file (default: %(default)s).')
+
+    subparsers.add_parser(
+        'accounts',
+        help='List archived accounts.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Binds all the functionality together."""
+    args = parse_args(argv)
+    with kmyimport.archive.Archive(args.archive) as archive:
+        if args.command == 'export':
+            count = kmyimport.archive.export(
+                archive, args.output, args.date_from, args.date_to,
+                args.accounts)
+            print("{} transactions written to {}".format(count, args.output))
+        elif args.command == 'accounts':
+            for account, count, first, last in archive.accounts():
+                print("{:<30}\t{:>8}\t{}\t{}".format(
+                    account, count, first, last))
@@ -0,0 +1,131 @@
+"""
+Streaming output of converted rows into multiple files.
+
+Each row is routed to its target file as soon as it is produced. Only a
+limited number of files is kept open at once; the least recently used one is
+closed when another has to be opened and it is appended to when a row for it
+comes again. The header is written once at the beginning of each file.
+"""
+
+from collections import OrderedDict
+import csv
+
+import kmyimport
+
+DEFAULT_MAX_OPEN = 32
+SPLIT_CHOICES = ("month", "year")
+
+
+def add_arguments(parser, choices=SPLIT_CHOICES, default=None):
+    """Add options controlling the split of output to the given parser."""
+    parser.add_argument(
+        '-s', '--split-by',
+        choices=choices,
+        default=default,
+        help='Write a separate output file for each {}.'.format(
+            ', '.join(choices)))
+    parser.add_argument(
+        '--max-open',
+        type=int,
+        default=DEFAULT_MAX_OPEN,
+        metavar='N',
+        help='Maximum number of output files open at once (default: {}).'
+        .format(DEFAULT_MAX_OPEN))
+
+
+class FanOutWriter:
+    """Writes rows to output files chosen per row.
+
+    Files written during lifetime of the writer are created anew; files
+    already present are overwritten on the first row routed to them.
+    """
+
+    def __init__(self, header, max_open=DEFAULT_MAX_OPEN):
+        if max_open < 1:
+            raise ValueError("max_open must be positive")
+        self.header = header
+        self.max_open = max_open
+        # file name -> (handle, csv writer) ordered from least recently used
+        self._pool = OrderedDict()
+        self._started = set()
+
+    @property
+    def file_names(self):
+        """Return names of all the files written so far."""
+        return sorted(self._started)
+
+    def _get_writer(self, file_name):
+        try:
+            self._pool.move_to_end(file_name)
+            return self._pool[file_name][1]
+        except KeyError:
+            pass
+        if len(self._pool) >= self.max_open:
+            _, (handle, _) = self._pool.popitem(last=False)
+            handle.close()
+        if file_name in self._started:
+            # appending to seekable file does not write BOM again
+            handle = open(file_name, "a", encoding='utf-16')
+        else:
+            handle = open(file_name, "w", encoding='utf-16')
+        writer = csv.writer(handle, delimiter=kmyimport.OUTDELIM,
+                            quoting=csv.QUOTE_ALL)
+        if file_name not in self._started:
+            writer.writerow(self.header)
+            self._started.add(file_name)
+        self._pool[file_name] = (handle, writer)
+        return writer
+
+    def writerow(self, file_name, row):
+        """Write the given row to the given file."""
+        self._get_writer(file_name).writerow(row)
+
+    def close(self):
+        """Close all the open files."""
+        while self._pool:
+            _, (handle, _) = self._pool.popitem(last=False)
+            handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get_period(row, split_by):
+    """Return the period of the given output row for the split.
+
+    Raises ValueError when the date of the row is not in the output format
+    (day month year).
+    """
+    day_month_year = row[kmyimport.Columns.DATE].split()
+    if (len(day_month_year) != 3
+            or not all(part.isdigit() for part in day_month_year)):
+        raise ValueError("cannot split by {}, invalid date {!r} in row {}"
+                         .format(split_by, row[kmyimport.Columns.DATE], row))
+    if split_by == "year":
+        return day_month_year[2]
+    return "{}-{}".format(day_month_year[2], day_month_year[1])
+
+
+def write_split(rows, input_name, split_by, max_open=DEFAULT_MAX_OPEN):
+    """Write the given output rows to a file per period.
+
+    The first row is expected to be the header. The output files are named
+    after the input file with the period inserted, e.g. for input
+    ``export.csv`` split by month ``export.2017-01.kmy.csv``.
+    """
+    rows = iter(rows)
+    header = next(rows)
+    names = {}
+    with FanOutWriter(header, max_open) as writer:
+        for row in rows:
+            period = get_period(row, split_by)
+            try:
+                file_name = names[period]
+            except KeyError:
+                file_name = names[period] = kmyimport.get_output_file_name(
+                    input_name, ".{}.kmy".format(period))
+            writer.writerow(file_name, row)
+        return writer.file_names
@@ -0,0 +1,41 @@
+"""
+Input formats of the supported banks and services.
+
+Each format module converts rows of the csv export into output rows described
+by kmyimport.Columns. The modules are imported only when needed.
+"""
+
+import importlib
+
+# format name -> (module, function yielding (currency, output row) pairs)
+FORMATS = {
+    "air": ("air", "iter_rows"),
+    "entropay": ("entropay", "iter_rows"),
+    "fio": ("fio", "iter_rows"),
+    "mbdcz": ("mbdcz", "iter_rows"),
+    "roklen-transactions": ("roklen", "iter_transaction_rows"),
+    "roklen-payments": ("roklen", "iter_payment_rows"),
+}
+# formats yielding rows in several currencies from a single export
+MULTI_CURRENCY_FORMATS = frozenset(("roklen-transactions", "roklen-payments"))
+DEFAULT_ENCODING = "utf-8"
+
+
+def get_format(name):
+    """Return the module implementing the given format."""
+    try:
+        module, _ = FORMATS[name]
+    except KeyError:
+        raise ValueError("unknown format {!r}, expected one of: {}".format(
+            name, ", ".join(sorted(FORMATS)))) from None
+    return importlib.import_module("kmyimport.formats." + module)
+
+
+def get_reader(name):
+    """Return reader function and default input encoding of the given format.
+
+    The reader yields pairs of (currency, output row) for a text file.
+    """
+    module = get_format(name)
+    return (getattr(module, FORMATS[name][1]),
+            getattr(module, "INPUT_ENCODING", DEFAULT_ENCODING))
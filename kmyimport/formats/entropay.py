@@ -0,0 +1,99 @@
+"""
+Conversion of rows of csv export files from Entropay to rows import-able by
+KMyMoney.
+"""
+
+import csv
+from datetime import datetime
+from enum import Enum
+import itertools
+import re
+
+import kmyimport
+
+
+class EntropayColumns(Enum):
+    """Enumeration of interesting columns of input csv file."""
+    DATE = 0
+    PAYEE = 1
+    AMOUNT = 4
+    ORIGINALCURRENCY = 5
+    ORIGINALAMOUNT = 6
+    FOREXRATE = 7
+    FEECURRENCY = 8
+    FEEAMOUNT = 9
+    NETAMOUNT = 11
+
+
+NAME = "entropay"
+INDELIM = ","
+PRIORITY_COLUMNS = (EntropayColumns.DATE.value,
+                    EntropayColumns.PAYEE.value,
+                    EntropayColumns.NETAMOUNT.value)
+MEMO_PRIORITY_COLUMNS = (EntropayColumns.ORIGINALCURRENCY.value,
+                         EntropayColumns.ORIGINALAMOUNT.value,
+                         EntropayColumns.FEECURRENCY.value,
+                         EntropayColumns.FEEAMOUNT.value)
+AMOUNT_COLUMNS = (EntropayColumns.AMOUNT.value,
+                  EntropayColumns.ORIGINALAMOUNT.value,
+                  EntropayColumns.FOREXRATE.value,
+                  EntropayColumns.FEEAMOUNT.value,
+                  EntropayColumns.NETAMOUNT.value)
+
+
+def is_column_amount(index):
+    """Returns true if the given index belongs to column containing amount."""
+    return index in AMOUNT_COLUMNS
+
+
+# (output column, input column, is amount) for each column copied to output;
+# there is no reference number in the input and no alternative columns
+ROW_COLUMNS = tuple(
+    (int(dest), src, is_column_amount(src))
+    for dest, src in zip((kmyimport.Columns.DATE, kmyimport.Columns.PAYEE,
+                          kmyimport.Columns.AMOUNT), PRIORITY_COLUMNS))
+_DAY_WITHOUT_PADDING = re.compile(r'^\d-')
+
+
+def transform_date(value):
+    """Parse the given data value and return string expected by KMyMoney."""
+    # zero pad the day of month number
+    value = _DAY_WITHOUT_PADDING.sub(r'0\g<0>', value)
+    return datetime.strptime(value, "%d-%b-%Y").strftime("%d %m %Y")
+
+
+def transform_row(column_names, row):
+    """Return modified data row of input."""
+    newrow = [""] * kmyimport.ROW_LENGTH
+    for dest, src, is_amount in ROW_COLUMNS:
+        newrow[dest] = kmyimport.data_sanitize(row[src], is_amount)
+    newrow[kmyimport.Columns.DATE] = transform_date(
+        newrow[kmyimport.Columns.DATE])
+    newrow[kmyimport.Columns.MEMO] = kmyimport.get_memo_column(
+        column_names, row,
+        MEMO_PRIORITY_COLUMNS, PRIORITY_COLUMNS, is_column_amount)
+    return newrow
+
+
+def transform(rows):
+    """
+    Yields modified row for each input row.
+
+    Data is sanitized and less important columns are merged into single memo
+    column.
+    """
+    yield kmyimport.get_output_header()
+    rows = iter(rows)
+    column_names = next(rows, None)
+    for row in rows:
+        yield transform_row(column_names, row)
+
+
+def iter_rows(handle):
+    """Yields a pair of (currency, output row) for each row of input.
+
+    The currency is not known.
+    """
+    rows = csv.reader(handle, delimiter=INDELIM, quotechar='"')
+    for row in itertools.islice(transform(rows), 1, None):
+        yield None, row
@@ -0,0 +1,111 @@
+"""
+Conversion of rows of csv export files from MailboxDE.cz to rows import-able by
+KMyMoney.
+"""
+
+import csv
+from enum import IntEnum
+import itertools
+
+import kmyimport
+
+
+class MBDColumns(IntEnum):
+    """Enumeration of interesting columns of input csv file."""
+    KREDIT = 0
+    DATE = 1
+    AMOUNT = 2
+    VARIABLE_SYMBOL = 3
+    PACKAGE_NUMBER = 4
+    FROM = 5
+    DESTINATION = 6
+    TRACKING_NUMBER = 7
+
+
+class KMyColumns(IntEnum):
+    """Enumeration of output collumns."""
+    DATE = 0
+    AMOUNT = 1
+    MEMO = 2
+
+
+NAME = "mbdcz"
+INDELIM = ";"
+INPUT_ENCODING = "iso-8859-2"
+PRIORITY_COLUMNS = (MBDColumns.DATE, MBDColumns.AMOUNT, MBDColumns.KREDIT)
+KMY2MBD = {
+    kmyimport.Columns.DATE: MBDColumns.DATE,
+    kmyimport.Columns.AMOUNT: MBDColumns.AMOUNT,
+}
+MEMO_PRIORITY_COLUMNS = (MBDColumns.FROM, MBDColumns.DESTINATION)
+AMOUNT_COLUMNS = (MBDColumns.AMOUNT, MBDColumns.KREDIT)
+
+
+def is_column_amount(index):
+    """Returns true if the given index belongs to column containing amount."""
+    return index in AMOUNT_COLUMNS
+
+
+# (output column, input column, is amount) for each column copied to output
+ROW_COLUMNS = tuple(
+    (int(dest), src, is_column_amount(src)) for dest, src in KMY2MBD.items())
+# the same for alternative columns filling the empty ones
+FALLBACK_COLUMNS = tuple(
+    (int(dest), src, is_column_amount(src))
+    for dest, src in [(kmyimport.Columns.AMOUNT, MBDColumns.KREDIT)])
+
+
+def merge_columns(row, original):
+    """Return row filled with data from alternative columns.
+
+    The row is modified in place.
+    """
+    for dest, src, is_amount in FALLBACK_COLUMNS:
+        if row[dest]:
+            continue
+        data = kmyimport.data_sanitize(original[src], is_amount)
+        if data:
+            row[dest] = data
+    return row
+
+
+def transform_date(value):
+    """Parse the given data value and return string expected by KMyMoney."""
+    return kmyimport.normalize_date(value)
+
+
+def transform_row(column_names, row):
+    """Return modified data row of input."""
+    newrow = [""] * kmyimport.ROW_LENGTH
+    for dest, src, is_amount in ROW_COLUMNS:
+        newrow[dest] = kmyimport.data_sanitize(row[src], is_amount)
+    newrow[kmyimport.Columns.DATE] = transform_date(
+        newrow[kmyimport.Columns.DATE])
+    newrow[kmyimport.Columns.MEMO] = kmyimport.get_memo_column(
+        column_names, row,
+        MEMO_PRIORITY_COLUMNS, PRIORITY_COLUMNS, is_column_amount)
+    return merge_columns(newrow, row)
+
+
+def transform(rows):
+    """
+    Yields modified row for each input row.
+
+    Data is sanitized and less important columns are merged into single memo
+    column.
+    """
+    yield kmyimport.get_output_header()
+    rows = iter(rows)
+    column_names = next(rows, None)
+    for row in rows:
+        yield transform_row(column_names, row)
+
+
+def iter_rows(handle):
+    """Yields a pair of (currency, output row) for each row of input.
+
+    The currency is not known.
+    """
+    rows = csv.reader(handle, delimiter=INDELIM, quotechar='"')
+    for row in itertools.islice(transform(rows), 1, None):
+        yield None, row
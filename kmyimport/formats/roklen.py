@@ -0,0 +1,240 @@
+"""
+Conversion of rows of csv export files from RoklenFX to rows import-able by
+KMyMoney.
+
+Each row of transactions file gives a transaction in each of the exchanged
+currencies, each row of payments file gives a single transaction.
+"""
+
+import csv
+from datetime import datetime
+from enum import IntEnum
+
+import kmyimport
+import kmyimport.resilient
+
+
+class TransColumns(IntEnum):
+    """Enumeration of columns of input transactions csv file."""
+    STATUS = 0
+    DATE = 1
+    REFNUM = 2
+    SOLD_AMOUNT = 3
+    SOLD_CURRENCY = 4
+    RATIO = 5
+    BOUGHT_AMOUNT = 6
+    BOUGHT_CURRENCY = 7
+    PAYEE = 8
+    AMOUNT = 9
+    VARIABLE_SYMBOL = 10
+    TYPE = 11
+
+
+class PayColumns(IntEnum):
+    """Enumeration of columns of payments csv file."""
+    DATE = 0
+    AMOUNT = 1
+    CURRENCY = 2
+    PAYEE = 3
+    REFNUM = 4
+    TRANSACTION_REFNUM = 5
+
+
+class DataColumns(IntEnum):
+    """Enumeration of internal data columns."""
+    REFNUM = 0
+    DATE = 1
+    PAYEE = 2
+    AMOUNT = 3
+    RATIO = 5
+    BOUGHT_AMOUNT = 6
+    BOUGHT_CURRENCY = 7
+    SOLD_CURRENCY = 8
+    VARIABLE_SYMBOL = 9
+    TYPE = 10
+    STATUS = 11
+    TRANSACTION_REFNUM = 12
+
+
+DATACOL_NAMES = {
+    DataColumns.RATIO: "Rate",
+    DataColumns.BOUGHT_AMOUNT: "Amount bought",
+    DataColumns.BOUGHT_CURRENCY: "Bought currency",
+    DataColumns.SOLD_CURRENCY: "Sold currency",
+    DataColumns.VARIABLE_SYMBOL: "Variable symbol",
+    DataColumns.TYPE: "Type",
+    DataColumns.STATUS: "Status",
+    DataColumns.TRANSACTION_REFNUM: "Reference number of transaction",
+}
+
+
+COLUMN_NAMES = [
+    DATACOL_NAMES.get(c, "") for c in DataColumns.__members__.values()
+]
+
+NAME = "roklen"
+INDELIM = ";"
+PRIORITY_COLUMNS = (DataColumns.REFNUM, DataColumns.DATE,
+                    DataColumns.PAYEE, DataColumns.AMOUNT)
+MEMO_PRIORITY_COLUMNS = (DataColumns.BOUGHT_AMOUNT,
+                         DataColumns.BOUGHT_CURRENCY,
+                         DataColumns.SOLD_CURRENCY,
+                         DataColumns.RATIO, DataColumns.TRANSACTION_REFNUM)
+AMOUNT_COLUMNS = (DataColumns.AMOUNT, DataColumns.BOUGHT_AMOUNT)
+
+
+def is_column_amount(index):
+    """Returns true if the given index belongs to column containing amount."""
+    return index in AMOUNT_COLUMNS
+
+
+# (output column, transaction column, is amount) for each column copied to
+# output
+ROW_COLUMNS = tuple(
+    (int(dest), src, is_column_amount(src))
+    for dest, src in zip(kmyimport.Columns, PRIORITY_COLUMNS))
+
+
+def transform_row(transaction):
+    """Return output row for the given transaction.
+
+    The data is sanitized (turned into strings).
+    """
+    newrow = [""] * kmyimport.ROW_LENGTH
+    for dest, src, is_amount in ROW_COLUMNS:
+        newrow[dest] = kmyimport.data_sanitize(transaction[src], is_amount)
+    newrow[kmyimport.Columns.MEMO] = kmyimport.get_memo_column(
+        COLUMN_NAMES, transaction,
+        MEMO_PRIORITY_COLUMNS, PRIORITY_COLUMNS, is_column_amount)
+    return newrow
+
+
+def transform(transactions):
+    """Yields rows for each transaction.
+
+    The data is sanitized (turned into strings).
+    """
+    yield kmyimport.get_output_header()
+    for transaction in transactions:
+        yield transform_row(transaction)
+
+
+def convert_transaction(row):
+    """Return a pair of (currency, transaction) for each side of exchange."""
+    result = []
+    sold_currency = row[TransColumns.SOLD_CURRENCY].lower()
+    transaction = {
+        DataColumns.REFNUM: row[TransColumns.REFNUM],
+        DataColumns.DATE: datetime.strptime(
+            row[TransColumns.DATE], '%Y/%m/%d'),
+        DataColumns.AMOUNT: "-" + row[TransColumns.SOLD_AMOUNT],
+        DataColumns.RATIO: row[TransColumns.RATIO],
+        DataColumns.BOUGHT_AMOUNT: row[TransColumns.BOUGHT_AMOUNT],
+        DataColumns.BOUGHT_CURRENCY: row[TransColumns.BOUGHT_CURRENCY],
+        DataColumns.STATUS: row[TransColumns.STATUS],
+    }
+
+    for attr in ["PAYEE", "VARIABLE_SYMBOL", "TYPE"]:
+        if row[TransColumns.__members__[attr]]:
+            transaction[DataColumns.__members__[attr]] = row[
+                TransColumns.__members__[attr]]
+    result.append((sold_currency, transaction))
+
+    bought_currency = row[TransColumns.BOUGHT_CURRENCY].lower()
+    transaction = {
+        DataColumns.REFNUM: row[TransColumns.REFNUM],
+        DataColumns.DATE: datetime.strptime(
+            row[TransColumns.DATE], '%Y/%m/%d'),
+        DataColumns.AMOUNT: row[TransColumns.BOUGHT_AMOUNT],
+        DataColumns.SOLD_CURRENCY: row[TransColumns.SOLD_CURRENCY],
+        DataColumns.RATIO: row[TransColumns.RATIO],
+        DataColumns.STATUS: row[TransColumns.STATUS],
+    }
+
+    for attr in ["PAYEE", "VARIABLE_SYMBOL", "TYPE"]:
+        if row[TransColumns.__members__[attr]]:
+            transaction[DataColumns.__members__[attr]] = row[
+                TransColumns.__members__[attr]]
+    result.append((bought_currency, transaction))
+    return result
+
+
+def convert_payment(row):
+    """Return a pair of (currency, transaction) for the given payment."""
+    currency = row[PayColumns.CURRENCY].lower()
+    transaction = {
+        DataColumns.REFNUM: row[PayColumns.REFNUM],
+        DataColumns.DATE: datetime.strptime(
+            row[PayColumns.DATE], '%d.%m.%Y'),
+        DataColumns.AMOUNT: "-" + row[PayColumns.AMOUNT],
+        DataColumns.PAYEE: row[PayColumns.PAYEE],
+        DataColumns.TRANSACTION_REFNUM:
+            row[PayColumns.TRANSACTION_REFNUM],
+    }
+    return [(currency, transaction)]
+
+
+def read_rows(reader, convert, quarantine=None):
+    """Yields a pair of (currency, transaction) for the given input.
+
+    Parameters
+    ----------
+    reader : CSV reader for the input file.
+    convert : function(row) -> list of (currency, transaction) pairs
+    quarantine : kmyimport.resilient.Quarantine
+                 When given, rows that fail to convert are written there
+                 instead of raising an error.
+    """
+    last_line = 0
+    for index, row in enumerate(reader):
+        line_num = last_line + 1
+        last_line = reader.line_num
+        if index == 0:  # skip header
+            continue
+        try:
+            converted = convert(row)
+        except kmyimport.resilient.ROW_ERRORS as err:
+            if quarantine is None:
+                raise
+            quarantine.add(line_num, row, err)
+            continue
+        yield from converted
+
+
+def read_transactions(reader, quarantine=None):
+    """Yields internal transactions for the given transactions input.
+
+    Parameters
+    ----------
+    reader : CSV reader for transactions file.
+    quarantine : kmyimport.resilient.Quarantine for invalid rows
+    """
+    return read_rows(reader, convert_transaction, quarantine)
+
+
+def read_payments(reader, quarantine=None):
+    """Yields internal transactions for the given payments input.
+
+    Parameters
+    ----------
+    reader : CSV reader for payments file.
+    quarantine : kmyimport.resilient.Quarantine for invalid rows
+    """
+    return read_rows(reader, convert_payment, quarantine)
+
+
+def iter_transaction_rows(handle):
+    """Yields a pair of (currency, output row) for transactions input.
+
+    Each row of input gives a pair for both of the exchanged currencies.
+    """
+    reader = csv.reader(handle, delimiter=INDELIM, quotechar='"')
+    for currency, transaction in read_transactions(reader):
+        yield currency, transform_row(transaction)
+
+
+def iter_payment_rows(handle):
+    """Yields a pair of (currency, output row) for payments input."""
+    reader = csv.reader(handle, delimiter=INDELIM, quotechar='"')
+    for currency, transaction in read_payments(reader):
+        yield currency, transform_row(transaction)
@@ -0,0 +1,27 @@
+"""
+Removal of html markup from the cells of input files.
+
+Kept apart from the main module so that the html parser gets imported only when
+some cell actually contains markup.
+"""
+
+from html.parser import HTMLParser
+
+
+class MLStripper(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.reset()
+        self.fed = []
+
+    def handle_data(self, d):
+        self.fed.append(d)
+
+    def get_data(self):
+        return ''.join(self.fed)
+
+
+def strip_tags(html):
+    stripper = MLStripper()
+    stripper.feed(html)
+    return stripper.get_data()
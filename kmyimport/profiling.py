@@ -0,0 +1,408 @@
+"""
+Profiling of the conversion hot path.
+
+In profiling mode the stages of the conversion are wrapped with counters kept
+per bank format, stage and input column:
+
+sanitize
+    kmyimport.data_sanitize of cells copied to the output columns,
+date
+    sanitizing and conversion of the date cell,
+memo
+    kmyimport.data_sanitize of cells merged into memo; the time spent in
+    get_memo_column as a whole is reported for the memo column of output.
+
+The report lists the most expensive columns by time together with the number
+of calls and volume of the input data in bytes. Optionally the run is also
+captured with cProfile or with a sampling profiler recording the stack of the
+main thread in regular intervals; their output is appended to the report.
+
+Cells are attributed to input columns without any help of the converters.
+The profiler wraps transform_row of the format module to learn the input row
+being converted and looks up each sanitized cell among the columns the
+transform reads, in the order it reads them. Fallback columns are looked up
+only for the output columns merge_columns is going to fill.
+
+Nothing is wrapped unless a profiler is started, so the regular conversion
+pays no overhead. The wrapped functions are module globals, so profiling
+affects every conversion running in the process. It is not safe to profile
+alongside kmyimport.aio or other conversions running concurrently in threads.
+"""
+
+import collections
+import contextlib
+import enum
+import sys
+import time
+
+import kmyimport
+
+MODES = ("counters", "cprofile", "sample")
+DEFAULT_INTERVAL = 0.001
+DEFAULT_TOP = 20
+STAGES = ("sanitize", "date", "memo")
+# column standing for get_memo_column as a whole
+MEMO_TOTAL = "<memo>"
+
+
+def add_arguments(parser):
+    """Add options controlling profiling to the given parser."""
+    parser.add_argument(
+        '--profile',
+        metavar='REPORT',
+        help='Profile the conversion and write the report to the given file'
+        ' ("-" for standard error).')
+    parser.add_argument(
+        '--profile-mode',
+        choices=MODES,
+        default=MODES[0],
+        help='Capture also cProfile statistics or stack samples of the run'
+        ' (default: %(default)s).')
+
+
+class Sampler:
+    """Samples stack of a thread in regular intervals in the background."""
+
+    def __init__(self, thread_id=None, interval=DEFAULT_INTERVAL):
+        import threading
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = 0
+        # function -> number of samples it was running in
+        self.own = collections.Counter()
+        # function -> number of samples it was on the stack in
+        self.total = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.own[_get_function(frame)] += 1
+            seen = set()
+            while frame is not None:
+                function = _get_function(frame)
+                if function not in seen:
+                    seen.add(function)
+                    self.total[function] += 1
+                frame = frame.f_back
+
+    def write_report(self, handle, top=DEFAULT_TOP):
+        handle.write("{} samples every {:g} ms\n\n".format(
+            self.samples, self.interval * 1000))
+        handle.write("{:>8} {:>8}  {}\n".format("own", "total", "function"))
+        for function, count in self.own.most_common(top):
+            handle.write("{:>7.1%} {:>7.1%}  {}\n".format(
+                count / self.samples, self.total[function] / self.samples,
+                function))
+
+
+def _get_function(frame):
+    code = frame.f_code
+    return "{}:{}({})".format(
+        code.co_filename, code.co_firstlineno, code.co_name)
+
+
+class Profiler:
+    """Counts time and data volume of conversion stages per column.
+
+    Parameters
+    ----------
+    mode : str
+           One of MODES.
+    interval : float
+               Sampling interval in seconds for the sample mode.
+    """
+
+    def __init__(self, mode=MODES[0], interval=DEFAULT_INTERVAL):
+        if mode not in MODES:
+            raise ValueError("unknown profiling mode {!r}".format(mode))
+        self.mode = mode
+        self.interval = interval
+        # (format, stage, column) -> [calls, seconds, bytes]
+        self.counters = collections.defaultdict(lambda: [0, 0.0, 0])
+        # format -> column names seen in its input
+        self.column_names = {}
+        self.elapsed = 0.0
+        self.format = None
+        self._stage = None
+        self._date_column = None
+        # input row being transformed
+        self._row = None
+        # columns of the row in the order they are sanitized, and the
+        # position of the next one
+        self._columns = ()
+        self._position = 0
+        self._row_columns = ()
+        self._fallback_columns = ()
+        self._originals = []
+        self._started = None
+        self._profile = None
+        self._sampler = None
+
+    def _patch(self, owner, name, replacement):
+        self._originals.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def start(self, module):
+        """Start profiling conversions done by the given format module."""
+        if self._originals:
+            raise RuntimeError("profiler is already running")
+        self.format = module.NAME
+        self._date_column = None
+        for dest, src, _ in getattr(module, "ROW_COLUMNS", ()):
+            if dest == kmyimport.Columns.DATE:
+                self._date_column = src
+        self._row_columns = tuple(
+            src for _, src, _ in getattr(module, "ROW_COLUMNS", ()))
+        self._fallback_columns = tuple(
+            (dest, src) for dest, src, _ in
+            getattr(module, "FALLBACK_COLUMNS", ()))
+        self._patch(module, "transform_row",
+                    self._wrap_transform_row(module.transform_row))
+        if hasattr(module, "merge_columns"):
+            self._patch(module, "merge_columns",
+                        self._wrap_merge(module.merge_columns))
+        self._patch(kmyimport, "data_sanitize",
+                    self._wrap_sanitize(kmyimport.data_sanitize))
+        self._patch(kmyimport, "get_memo_column",
+                    self._wrap_memo(kmyimport.get_memo_column))
+        if hasattr(module, "transform_date"):
+            self._patch(module, "transform_date",
+                        self._wrap_date(module.transform_date))
+        if self.mode == "cprofile":
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.mode == "sample":
+            self._sampler = Sampler(interval=self.interval)
+            self._sampler.start()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        """Stop profiling and restore the wrapped functions."""
+        if self._started is None:
+            return
+        self.elapsed += time.perf_counter() - self._started
+        self._started = None
+        if self._profile:
+            self._profile.disable()
+        if self._sampler:
+            self._sampler.stop()
+        while self._originals:
+            owner, name, original = self._originals.pop()
+            setattr(owner, name, original)
+
+    def _wrap_sanitize(self, sanitize):
+        counters = self.counters
+        clock = time.perf_counter
+
+        def wrapper(data, is_amount=False):
+            start = clock()
+            result = sanitize(data, is_amount)
+            elapsed = clock() - start
+            column = self._find_column(data)
+            stage = self._stage
+            if stage is None:
+                stage = "date" if column == self._date_column else "sanitize"
+            counter = counters[self.format, stage, column]
+            counter[0] += 1
+            counter[1] += elapsed
+            if isinstance(data, str):
+                counter[2] += len(data.encode('utf-8'))
+            return result
+        return wrapper
+
+    def _find_column(self, data):
+        """Return the column of the row being transformed holding data.
+
+        The columns are searched from the one following the last found, so
+        that equal cells of different columns are told apart.
+        """
+        row = self._row
+        columns = self._columns
+        for position in range(self._position, len(columns)):
+            try:
+                cell = row[columns[position]]
+            except (IndexError, KeyError, TypeError):
+                continue
+            if cell is data:
+                self._position = position + 1
+                return columns[position]
+        return None
+
+    def _wrap_transform_row(self, transform_row):
+
+        def wrapper(*args):
+            # the input row is the last argument
+            self._row = args[-1]
+            self._columns = self._row_columns
+            self._position = 0
+            try:
+                return transform_row(*args)
+            finally:
+                self._row = None
+        return wrapper
+
+    def _wrap_merge(self, merge_columns):
+
+        def wrapper(row, original):
+            # only the empty output columns are filled from the fallbacks
+            self._columns = tuple(src for dest, src in self._fallback_columns
+                                  if not row[dest])
+            self._position = 0
+            return merge_columns(row, original)
+        return wrapper
+
+    def _wrap_memo(self, get_memo_column):
+        counters = self.counters
+        clock = time.perf_counter
+
+        def wrapper(column_names, row, priority_columns=(), skip_columns=(),
+                    *args, **kwargs):
+            if self.format not in self.column_names:
+                self.column_names[self.format] = column_names
+            columns, position = self._columns, self._position
+            self._columns = kmyimport._get_memo_order(
+                len(column_names), len(row), tuple(priority_columns),
+                frozenset(skip_columns))
+            self._position = 0
+            self._stage = "memo"
+            start = clock()
+            try:
+                result = get_memo_column(column_names, row, priority_columns,
+                                         skip_columns, *args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                self._stage = None
+                self._columns, self._position = columns, position
+            counter = counters[self.format, "memo", MEMO_TOTAL]
+            counter[0] += 1
+            counter[1] += elapsed
+            counter[2] += len(result.encode('utf-8'))
+            return result
+        return wrapper
+
+    def _wrap_date(self, transform_date):
+        counters = self.counters
+        clock = time.perf_counter
+
+        def wrapper(value):
+            start = clock()
+            result = transform_date(value)
+            # the call is counted when the same cell is sanitized
+            counter = counters[self.format, "date", self._date_column]
+            counter[1] += clock() - start
+            return result
+        return wrapper
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def get_column_name(self, format, column):
+        """Return readable name of the given input column of the format."""
+        if column == MEMO_TOTAL:
+            return column
+        try:
+            name = self.column_names[format][column]
+        except (KeyError, IndexError, TypeError):
+            name = None
+        if name:
+            return name
+        if isinstance(column, enum.Enum):
+            return column.name
+        return str(column)
+
+    def get_columns(self, format):
+        """Return list of (column, calls, seconds, bytes) ordered by time.
+
+        Counters of all the stages are summed up per column.
+        """
+        columns = collections.OrderedDict()
+        for (fmt, _, column), (calls, seconds, size) in \
+                self.counters.items():
+            if fmt != format or column == MEMO_TOTAL:
+                continue
+            total = columns.setdefault(column, [0, 0.0, 0])
+            total[0] += calls
+            total[1] += seconds
+            total[2] += size
+        return sorted(((column,) + tuple(total)
+                       for column, total in columns.items()),
+                      key=lambda item: item[2], reverse=True)
+
+    def get_stages(self, format):
+        """Return list of (stage, seconds) for the given format."""
+        totals = dict.fromkeys(STAGES, 0.0)
+        for (fmt, stage, column), (_, seconds, _) in self.counters.items():
+            if fmt != format:
+                continue
+            # memo cells are already included in the memo total
+            if stage == "memo" and column != MEMO_TOTAL:
+                continue
+            totals[stage] += seconds
+        return [(stage, totals[stage]) for stage in STAGES]
+
+    def write_report(self, handle, top=DEFAULT_TOP):
+        """Write the report of the profiled runs to the given text file."""
+        formats = sorted({fmt for fmt, _, _ in self.counters})
+        handle.write("Profile of conversion taking {:.3f} s\n".format(
+            self.elapsed))
+        for format in formats:
+            handle.write("\n{}\n{}\n".format(format, "=" * len(format)))
+            for stage, seconds in self.get_stages(format):
+                handle.write("{:<10} {:>10.3f} ms\n".format(
+                    stage, seconds * 1000))
+            handle.write("\n{:<30} {:>10} {:>12} {:>8} {:>12}\n".format(
+                "column", "calls", "time [ms]", "share", "bytes"))
+            columns = self.get_columns(format)
+            total = sum(item[2] for item in columns) or 1.0
+            for column, calls, seconds, size in columns[:top]:
+                handle.write("{:<30} {:>10} {:>12.3f} {:>8.1%} {:>12}\n"
+                             .format(self.get_column_name(format, column)[:30],
+                                     calls, seconds * 1000, seconds / total,
+                                     size))
+        if self._profile:
+            import pstats
+            handle.write("\ncProfile\n========\n")
+            stats = pstats.Stats(self._profile, stream=handle)
+            stats.sort_stats("cumulative").print_stats(top)
+        if self._sampler:
+            handle.write("\nSamples\n=======\n")
+            self._sampler.write_report(handle, top)
+
+
+@contextlib.contextmanager
+def session(args, module):
+    """Profile conversions done by the given format module if requested.
+
+    Profiling is requested by the options of add_arguments in the parsed
+    args. The report is written when the block finishes.
+    """
+    if not getattr(args, "profile", None):
+        yield None
+        return
+    profiler = Profiler(args.profile_mode)
+    profiler.start(module)
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        if args.profile == "-":
+            profiler.write_report(sys.stderr)
+        else:
+            with open(args.profile, "wt", encoding='utf-8') as handle:
+                profiler.write_report(handle)
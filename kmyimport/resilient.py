@@ -0,0 +1,278 @@
+"""
+Resilient conversion of long input files.
+
+Rows that cannot be converted are written to a quarantine file together with
+their line number and the reason of failure instead of aborting the whole
+conversion. The progress is regularly saved to a checkpoint file so that an
+interrupted conversion can be resumed where it stopped.
+"""
+
+import codecs
+import csv
+import os
+
+import kmyimport
+
+CHECKPOINT_SUFFIX = ".checkpoint"
+QUARANTINE_TAG = ".rejected"
+DEFAULT_CHECKPOINT_EVERY = 10000
+# errors raised by converters on malformed rows
+ROW_ERRORS = (IndexError, KeyError, ValueError)
+
+
+def add_arguments(parser, checkpoint=True):
+    """Add options controlling the resilient mode to the given parser."""
+    parser.add_argument(
+        '-r', '--resilient',
+        action='store_true',
+        help='Write invalid rows to a quarantine file instead of failing.'
+        + (' Resume the conversion from a checkpoint if there is one.'
+           if checkpoint else ''))
+    if checkpoint:
+        parser.add_argument(
+            '--checkpoint-every',
+            type=int,
+            default=DEFAULT_CHECKPOINT_EVERY,
+            metavar='N',
+            help='Save progress every N rows in resilient mode (default: {}).'
+            ' Zero disables checkpoints.'.format(DEFAULT_CHECKPOINT_EVERY))
+
+
+class Quarantine:
+    """Writes rows that failed to convert to a csv file.
+
+    The file is created lazily with the first rejected row.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.count = 0
+        self._handle = None
+        self._writer = None
+
+    def _open(self, size=None):
+        if size is None:
+            self._handle = open(self.file_name, "w", encoding='utf-8',
+                                newline='')
+        else:
+            with open(self.file_name, "r+b") as handle:
+                handle.truncate(size)
+            self._handle = open(self.file_name, "a", encoding='utf-8',
+                                newline='')
+        self._writer = csv.writer(self._handle, delimiter=kmyimport.OUTDELIM,
+                                  quoting=csv.QUOTE_ALL)
+        if size is None:
+            self._writer.writerow(["Line", "Reason"])
+
+    def resume(self, size):
+        """Continue writing to an existing file truncated to the given size."""
+        if size:
+            self._open(size)
+
+    def add(self, line_num, row, error):
+        """Record the given row that failed with the given error."""
+        if self._writer is None:
+            self._open()
+        self._writer.writerow(
+            [line_num, "{}: {}".format(type(error).__name__, error)] + row)
+        self.count += 1
+
+    def tell(self):
+        """Return the size of the file written so far."""
+        if self._handle is None:
+            return 0
+        self._handle.flush()
+        return self._handle.buffer.tell()
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+
+
+class LineReader:
+    """Iterates over decoded lines of binary file keeping track of offset.
+
+    The offset always points right behind the last line returned, thus it
+    marks the end of the last row read by csv reader.
+    """
+
+    def __init__(self, handle, encoding, offset=0):
+        self.handle = handle
+        self.handle.seek(offset)
+        self.offset = offset
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.handle.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return self._decoder.decode(line)
+
+
+def get_checkpoint_file_name(output_name):
+    """Return the name of checkpoint file belonging to the given output."""
+    return output_name + CHECKPOINT_SUFFIX
+
+
+def load_checkpoint(file_name, input_name):
+    """Return saved state for the given input or None if there is none.
+
+    Checkpoint made for different or modified input file is ignored.
+    """
+    import json
+    try:
+        with open(file_name, "rt", encoding='utf-8') as handle:
+            state = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    stat = os.stat(input_name)
+    if (state.get("input") != os.path.abspath(input_name)
+            or state.get("input_size") != stat.st_size
+            or state.get("input_mtime") != stat.st_mtime):
+        return None
+    return state
+
+
+def save_checkpoint(file_name, state):
+    """Atomically write the given state to the checkpoint file."""
+    import json
+    tmp_name = file_name + ".tmp"
+    with open(tmp_name, "wt", encoding='utf-8') as handle:
+        json.dump(state, handle)
+    os.replace(tmp_name, file_name)
+
+
+def process_file(input_file,
+                 transform_row,
+                 delimiter,
+                 encoding=None,
+                 preamble=None,
+                 checkpoint_every=DEFAULT_CHECKPOINT_EVERY,
+                 rules=None,
+                 archive=None,
+                 account=None,
+                 source=None):
+    """Writes a new file for the given csv file with .kmy.csv suffix.
+
+    Rows for which transform_row raises one of ROW_ERRORS are written to
+    quarantine file with .rejected.csv suffix. Unless checkpoint_every is
+    zero, the state is saved every checkpoint_every rows to a file next to
+    the output and the conversion is resumed from it when run again.
+
+    Parameters
+    ----------
+    input_file : file object opened either in text or binary mode
+                 It will be closed and reopened again in binary mode.
+    transform_row : function(column_names, row) -> list
+                    Converts single data row of input.
+    delimiter : str
+                Delimiter of input csv file.
+    encoding : str
+               Encoding of input file. Detected when not given.
+    preamble : function(rows) -> kmyimport.StatementInfo or None
+               Consumes rows preceding the header of input.
+    rules : kmyimport.rules.RuleSet
+            Rules normalizing the output rows.
+    archive : kmyimport.archive.Archive
+              Archive to store the output rows in under the given account and
+              source. The account defaults to the one of the statement
+              returned by preamble, or to the source.
+    """
+    header = kmyimport.get_output_header()
+    if rules:
+        header = rules.get_output_header()
+        transform_row = rules.wrap(transform_row)
+    input_name = input_file.name
+    if not encoding:
+        encoding = getattr(input_file, "encoding", None)
+    input_file.close()
+    output_name = kmyimport.get_output_file_name(input_name)
+    checkpoint_name = get_checkpoint_file_name(output_name)
+    quarantine = Quarantine(
+        kmyimport.get_output_file_name(input_name, QUARANTINE_TAG))
+    state = None
+    if checkpoint_every:
+        state = load_checkpoint(checkpoint_name, input_name)
+
+    with open(input_name, "rb") as handle:
+        if state:
+            encoding = state["encoding"]
+            with open(output_name, "r+b") as output:
+                output.truncate(state["output_size"])
+            output = open(output_name, "a", encoding='utf-16')
+            quarantine.resume(state["quarantine_size"])
+            quarantine.count = state["rejected"]
+            lines = LineReader(handle, encoding, state["offset"])
+            column_names = state["column_names"]
+            account = state.get("account", account)
+            line_base = state["line_num"]
+            count = state["rows"]
+        else:
+            if not encoding:
+                import chardet
+                encoding = chardet.detect(handle.read(32))['encoding']
+            output = open(output_name, "w", encoding='utf-16')
+            lines = LineReader(handle, encoding)
+            column_names = None
+            line_base = 0
+            count = 0
+        writer = csv.writer(output, delimiter=kmyimport.OUTDELIM,
+                            quoting=csv.QUOTE_ALL)
+        rows = csv.reader(lines, delimiter=delimiter, quotechar='"')
+        if column_names is None:
+            writer.writerow(header)
+            info = preamble(rows) if preamble else None
+            if not account:
+                account = getattr(info, "account", None) or source
+            column_names = next(rows, None)
+        if archive:
+            transform_row = archive.wrap(transform_row, account, source,
+                                         input_name, count)
+
+        last_line = line_base + rows.line_num
+        try:
+            for row in rows:
+                # number of the first line of the row
+                line_num = last_line + 1
+                last_line = line_base + rows.line_num
+                try:
+                    writer.writerow(transform_row(column_names, row))
+                except ROW_ERRORS as err:
+                    quarantine.add(line_num, row, err)
+                count += 1
+                if checkpoint_every and count % checkpoint_every == 0:
+                    output.flush()
+                    # the checkpoint must not claim rows not archived yet
+                    if archive:
+                        archive.flush()
+                    stat = os.stat(input_name)
+                    save_checkpoint(checkpoint_name, {
+                        "input": os.path.abspath(input_name),
+                        "input_size": stat.st_size,
+                        "input_mtime": stat.st_mtime,
+                        "encoding": encoding,
+                        "offset": lines.offset,
+                        "line_num": last_line,
+                        "rows": count,
+                        "rejected": quarantine.count,
+                        "output_size": output.buffer.tell(),
+                        "quarantine_size": quarantine.tell(),
+                        "column_names": column_names,
+                        "account": account,
+                    })
+        finally:
+            output.close()
+            quarantine.close()
+            if archive:
+                archive.flush()
+
+    if os.path.exists(checkpoint_name):
+        os.remove(checkpoint_name)
+    if quarantine.count:
+        print("{}: {} invalid rows written to {}".format(
+            input_name, quarantine.count, quarantine.file_name))
+    return count
@@ -0,0 +1,222 @@
+"""
+Normalization of payees and categories according to a rule file.
+
+The rule file is a csv file delimited by semicolons with the following
+columns::
+
+    pattern;payee;category;tags
+
+Pattern is a regular expression searched case-insensitively in the payee of
+each transaction. The payee is replaced with the canonical one unless it is
+left empty, category is written to additional output column and tags
+(separated by spaces) are appended to memo. Empty lines and lines starting
+with ``#`` are ignored.
+
+All the patterns are compiled into a single alternation, so each row is
+matched with one search regardless of number of rules. When several patterns
+match, the one matching earliest in the payee wins; among patterns matching
+at the same position the one listed first wins. Because of that, patterns
+must not contain backreferences, named groups or inline flags applying to the
+whole expression such as ``(?i)``; scoped flags such as ``(?i:...)`` are
+fine.
+
+Parsed rules together with the combined expression are cached in a file next
+to the rule file and reused until the rule file changes.
+"""
+
+import os
+import re
+
+import kmyimport
+
+CACHE_SUFFIX = ".cache"
+CACHE_VERSION = 1
+CATEGORY_HEADER = "Category"
+TAGS_NAME = "Tags"
+# parts of pattern syntax that break when patterns are combined
+_SYNTAX = re.compile(r"""
+    \\(?P<escape>.)                # escaped character
+  | \[\^?\]?(?:\\.|[^\]\\])*\]    # character class
+  | \(\?(?P<flags>[aiLmsux]+)\)   # inline global flags
+  | (?P<conditional>\(\?\()       # conditional group reference
+""", re.VERBOSE | re.DOTALL)
+
+
+class Rule:
+    """Canonical values assigned to payees matching single pattern."""
+
+    __slots__ = ('pattern', 'payee', 'category', 'tags')
+
+    def __init__(self, pattern, payee="", category="", tags=()):
+        self.pattern = pattern
+        self.payee = payee
+        self.category = category
+        self.tags = tuple(tags)
+
+
+def get_unsupported(pattern):
+    """Return description of syntax of the pattern that cannot be combined.
+
+    Returns None when the pattern can be combined with others. The pattern is
+    expected to be a valid regular expression.
+    """
+    if re.compile(pattern).groupindex:
+        return "named groups are not supported"
+    for match in _SYNTAX.finditer(pattern):
+        if match.group("escape") and match.group("escape") in "123456789":
+            return "backreferences are not supported"
+        if match.group("flags"):
+            return "inline flags must be scoped, e.g. (?{}:...)".format(
+                match.group("flags"))
+        if match.group("conditional"):
+            return "conditional group references are not supported"
+    return None
+
+
+def parse_rules(handle):
+    """Return list of rules read from the given text file.
+
+    Raises ValueError naming the line of an invalid rule.
+    """
+    import csv
+    rules = []
+    reader = csv.reader(handle, delimiter=kmyimport.OUTDELIM, quotechar='"')
+    for row in reader:
+        if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+            continue
+        row = [c.strip() for c in row] + [""] * (4 - len(row))
+        try:
+            re.compile(row[0])
+        except re.error as err:
+            raise ValueError("invalid pattern {!r} on line {}: {}".format(
+                row[0], reader.line_num, err)) from err
+        error = get_unsupported(row[0])
+        if error:
+            raise ValueError("invalid pattern {!r} on line {}: {}".format(
+                row[0], reader.line_num, error))
+        rules.append(Rule(row[0], row[1], row[2], row[3].split()))
+    try:
+        re.compile(combine_patterns(rules)[0], re.IGNORECASE)
+    except re.error as err:
+        raise ValueError("patterns cannot be combined: {}".format(err)) \
+            from err
+    return rules
+
+
+def combine_patterns(rules):
+    """Return source of single regular expression matching any rule.
+
+    Each pattern is enclosed in its own group. The returned list maps group
+    indexes of the expression to indexes of rules.
+    """
+    parts = []
+    groups = [None]
+    for index, rule in enumerate(rules):
+        groups.append(index)
+        parts.append("(" + rule.pattern + ")")
+        groups.extend([None] * re.compile(rule.pattern).groups)
+    return "|".join(parts), groups
+
+
+class RuleSet:
+    """Rules compiled into a combined matcher."""
+
+    def __init__(self, rules, source=None, groups=None):
+        if source is None:
+            source, groups = combine_patterns(rules)
+        self.rules = rules
+        self.source = source
+        self.groups = groups
+        self._regex = re.compile(source, re.IGNORECASE) if rules else None
+
+    def match(self, text):
+        """Return the rule matching the given text or None."""
+        if self._regex is None:
+            return None
+        match = self._regex.search(text)
+        if match is None:
+            return None
+        # the group enclosing whole pattern is always the last one closed
+        return self.rules[self.groups[match.lastindex]]
+
+    def get_output_header(self):
+        return kmyimport.get_output_header() + [CATEGORY_HEADER]
+
+    def apply(self, row):
+        """Return the given output row normalized by the matching rule.
+
+        The row is extended with category column.
+        """
+        rule = self.match(row[kmyimport.Columns.PAYEE])
+        if rule is None:
+            row.append("")
+            return row
+        if rule.payee:
+            row[kmyimport.Columns.PAYEE] = rule.payee
+        if rule.tags:
+            tags = "{}{}{}".format(
+                TAGS_NAME, kmyimport.MEMO_SEP, " ".join(rule.tags))
+            memo = row[kmyimport.Columns.MEMO]
+            row[kmyimport.Columns.MEMO] = memo + "\n" + tags if memo else tags
+        row.append(rule.category)
+        return row
+
+    def transform(self, rows):
+        """Yields rows of the given output normalized.
+
+        The first row is expected to be the header.
+        """
+        for index, row in enumerate(rows):
+            if index == 0:
+                yield self.get_output_header()
+            else:
+                yield self.apply(row)
+
+    def wrap(self, transform_row):
+        """Return transform_row function applying rules on its result."""
+        def wrapper(column_names, row):
+            return self.apply(transform_row(column_names, row))
+        return wrapper
+
+
+def get_cache_file_name(file_name):
+    """Return the name of cache file belonging to the given rule file."""
+    return file_name + CACHE_SUFFIX
+
+
+def load(file_name):
+    """Return rule set read from the given rule file.
+
+    Cached rules are used when the rule file has not changed since they were
+    stored. Otherwise the cache is rebuilt.
+    """
+    import pickle
+    stat = os.stat(file_name)
+    signature = (CACHE_VERSION, stat.st_size, stat.st_mtime)
+    cache_name = get_cache_file_name(file_name)
+    try:
+        with open(cache_name, "rb") as handle:
+            cached_signature, rules, source, groups = pickle.load(handle)
+        if cached_signature == signature:
+            return RuleSet(rules, source, groups)
+    except (OSError, EOFError, ValueError, TypeError,
+            pickle.UnpicklingError):
+        pass
+
+    with open(file_name, "rt", encoding='utf-8') as handle:
+        ruleset = RuleSet(parse_rules(handle))
+    try:
+        with open(cache_name, "wb") as handle:
+            pickle.dump((signature, ruleset.rules, ruleset.source,
+                         ruleset.groups), handle)
+    except OSError:
+        pass
+    return ruleset
+
+
+def add_arguments(parser):
+    """Add option for loading rules to the given parser."""
+    parser.add_argument(
+        '--rules',
+        metavar='FILE',
+        help='Normalize payees, categories and tags according to rule file.')
@@ -0,0 +1,87 @@
+"""
+Streaming library interface to the converters.
+
+Transactions are read lazily from any binary stream and yielded one by one as
+typed objects, without writing intermediate files::
+
+    with open("export.csv", "rb") as handle:
+        for transaction in kmyimport.iter_transactions(handle, "fio"):
+            print(transaction.date, transaction.amount, transaction.payee)
+
+Text fields hold the same sanitized values as the columns of .kmy.csv output.
+"""
+
+import datetime
+from decimal import Decimal
+import io
+import os
+from typing import Iterator, NamedTuple, Optional
+
+import kmyimport
+import kmyimport.formats
+
+
+class Transaction(NamedTuple):
+    """Single converted transaction."""
+    refnum: str
+    date: datetime.date
+    payee: str
+    amount: Optional[Decimal]
+    memo: str
+    currency: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row, currency=None):
+        """Return transaction made of the given output row.
+
+        Raises ValueError naming the row when its date or amount cannot be
+        parsed.
+        """
+        try:
+            date = datetime.datetime.strptime(
+                row[kmyimport.Columns.DATE], "%d %m %Y").date()
+            amount = kmyimport.parse_decimal(row[kmyimport.Columns.AMOUNT])
+        except ValueError as error:
+            raise ValueError("cannot read transaction from row {!r}: {}"
+                             .format(row, error)) from None
+        return cls(
+            row[kmyimport.Columns.REFNUM],
+            date,
+            row[kmyimport.Columns.PAYEE],
+            amount,
+            row[kmyimport.Columns.MEMO],
+            currency.upper() if currency else None)
+
+
+def iter_transactions(source, format,
+                      encoding=None) -> Iterator[Transaction]:
+    """Yields transactions read from the given source in the given format.
+
+    Parameters
+    ----------
+    source : binary or text file object, or path of the file
+             File objects are read lazily and left open.
+    format : str
+             One of kmyimport.formats.FORMATS.
+    encoding : str
+               Encoding of binary input. Each format has its own default.
+    """
+    reader, default_encoding = kmyimport.formats.get_reader(format)
+    encoding = encoding or default_encoding
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, "rt", encoding=encoding, newline='') as handle:
+            yield from _iter_transactions(reader, handle)
+    elif isinstance(source, io.TextIOBase):
+        yield from _iter_transactions(reader, source)
+    else:
+        handle = io.TextIOWrapper(source, encoding=encoding, newline='')
+        try:
+            yield from _iter_transactions(reader, handle)
+        finally:
+            # keep the caller's stream open
+            handle.detach()
+
+
+def _iter_transactions(reader, handle):
+    for currency, row in reader(handle):
+        yield Transaction.from_row(row, currency)
@@ -12,11 +12,12 @@ setup(name='kmyimport',
       author='Michal Minář',
       author_email='mic.liamg@gmail.com',
       url="https://github.com/michojel/kmyimport",
-      packages=['kmyimport'],
+      packages=['kmyimport', 'kmyimport.formats'],
       scripts=[
           'bin/air2kmy.py',
           'bin/entropay2kmy.py',
           'bin/fio2kmy.py',
+          'bin/kmyimport',
           'bin/mbdcz2kmy.py',
           'bin/roklen2kmy.py'
       ],
@@ -0,0 +1,128 @@
+"""Tests of kmyimport.aio."""
+
+import asyncio
+import concurrent.futures
+import csv
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+import kmyimport.aio
+
+from test_resilient import make_export
+
+
+class RecordingExecutor(concurrent.futures.ThreadPoolExecutor):
+    """Keeps the futures of all the work submitted.
+
+    The work waits for the release event once started is set.
+    """
+
+    def __init__(self):
+        super().__init__(2)
+        self.futures = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def submit(self, function, *args, **kwargs):
+        def blocking():
+            self.started.set()
+            self.release.wait()
+            return function(*args, **kwargs)
+        future = super().submit(blocking)
+        self.futures.append(future)
+        return future
+
+
+class BatchConverterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.executor = RecordingExecutor()
+        self.addCleanup(self.executor.shutdown)
+        self.addCleanup(self.executor.release.set)
+        self.converter = kmyimport.aio.BatchConverter(
+            executor=self.executor, batch_size=3)
+        self.addCleanup(self.converter.close)
+
+    def make_job(self, count):
+        source = os.path.join(self._dir.name, "export.csv")
+        with open(source, "wt", encoding='utf-8', newline='') as handle:
+            handle.write(make_export(count))
+        return kmyimport.aio.Job(source, "fio", encoding='utf-8')
+
+    def test_convert(self):
+        job = self.make_job(10)
+        fractions = []
+        self.loop.run_until_complete(self.converter.convert(
+            job, progress=lambda job: fractions.append(job.fraction)))
+        with open(job.output, "rt", encoding='utf-16', newline='') as handle:
+            rows = list(csv.reader(handle, delimiter=";"))
+        self.assertEqual(len(rows), 11)
+        self.assertEqual(rows[1][0], "1")
+        self.assertEqual(job.rows, 10)
+        self.assertEqual(fractions[-1], 1.0)
+        self.assertEqual(fractions, sorted(fractions))
+
+    def test_multi_currency_format_rejected(self):
+        for format in ("roklen-transactions", "roklen-payments"):
+            with self.assertRaisesRegex(ValueError, "several currencies"):
+                kmyimport.aio.Job("transactions.csv", format)
+
+    def test_cancel_waits_for_workers(self):
+        job = self.make_job(10)
+
+        async def cancel():
+            self.executor.release.clear()
+            task = self.converter.submit(job)
+            while not self.executor.started.is_set():
+                await asyncio.sleep(0.001)
+            task.cancel()
+            # the worker is still running, the task must not finish yet
+            done, _ = await asyncio.wait([task], timeout=0.05)
+            self.assertFalse(done)
+            self.executor.release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        self.loop.run_until_complete(cancel())
+        self.assertTrue(self.executor.futures)
+        self.assertTrue(all(f.done() for f in self.executor.futures))
+        self.assertFalse(os.path.exists(job.output))
+
+    def test_cancel_twice_keeps_loop_running(self):
+        job = self.make_job(10)
+
+        async def cancel():
+            self.executor.release.clear()
+            task = self.converter.submit(job)
+            while not self.executor.started.is_set():
+                await asyncio.sleep(0.001)
+            task.cancel()
+            await asyncio.sleep(0.01)
+            task.cancel()
+            # releases the worker even if the loop got blocked
+            timer = threading.Timer(1, self.executor.release.set)
+            timer.start()
+            self.addCleanup(timer.cancel)
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            self.assertLess(time.perf_counter() - start, 0.5)
+            self.assertFalse(task.done())
+            self.executor.release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        self.loop.run_until_complete(cancel())
+        self.assertTrue(all(f.done() for f in self.executor.futures))
+        self.assertFalse(os.path.exists(job.output))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+"""Tests of kmyimport.archive."""
+
+import io
+import unittest
+
+import kmyimport
+import kmyimport.archive
+
+HEADER = kmyimport.get_output_header()
+
+
+def make_row(date, payee, amount, refnum=""):
+    row = [""] * kmyimport.ROW_LENGTH
+    row[kmyimport.Columns.REFNUM] = refnum
+    row[kmyimport.Columns.DATE] = date
+    row[kmyimport.Columns.PAYEE] = payee
+    row[kmyimport.Columns.AMOUNT] = amount
+    return row
+
+
+# two identical purchases on the same day
+ROWS = [make_row("01 01 2017", "Coffee", "-3.00"),
+        make_row("01 01 2017", "Coffee", "-3.00"),
+        make_row("02 01 2017", "Bakery", "-1.50")]
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.archive = kmyimport.archive.Archive(":memory:")
+        self.addCleanup(self.archive.close)
+
+    def archive_rows(self, rows, file_name="export.csv", account="acc"):
+        for _ in self.archive.watch([HEADER] + [list(r) for r in rows],
+                                    account, "test", file_name):
+            pass
+
+    def count(self):
+        return sum(count for _, count, _, _ in self.archive.accounts())
+
+    def test_identical_rows_are_kept(self):
+        self.archive_rows(ROWS)
+        self.assertEqual(self.count(), 3)
+
+    def test_same_file_is_archived_once(self):
+        self.archive_rows(ROWS)
+        self.archive_rows(ROWS, "other/dir/export.csv")
+        self.assertEqual(self.count(), 3)
+
+    def test_rows_with_refnum_are_deduplicated_across_files(self):
+        rows = [make_row("01 01 2017", "Coffee", "-3.00", "R1"),
+                make_row("02 01 2017", "Bakery", "-1.50", "R2")]
+        self.archive_rows(rows, "january.csv")
+        self.archive_rows(rows[1:], "february.csv")
+        self.assertEqual(self.count(), 2)
+
+    def test_wrap_resumes_with_the_same_origins(self):
+        self.archive_rows(ROWS)
+        transform_row = self.archive.wrap(
+            lambda column_names, row: list(row), "acc", "test",
+            "export.csv", start=1)
+        for row in ROWS[1:]:
+            transform_row(HEADER, row)
+        self.archive.flush()
+        self.assertEqual(self.count(), 3)
+
+    def test_export_date_range(self):
+        self.archive_rows(ROWS)
+        output = io.StringIO()
+        count = kmyimport.archive.export(
+            self.archive, output, "2017-01-02", "2017-12-31")
+        self.assertEqual(count, 1)
+        self.assertIn("Bakery", output.getvalue())
+
+    def test_invalid_date_is_rejected(self):
+        for date in ("01.01.2017", "31 02 2017", ""):
+            with self.assertRaisesRegex(ValueError, "cannot archive row"):
+                self.archive.add("acc", "test", make_row(date, "x", "1"))
+        self.archive.flush()
+        self.assertEqual(self.count(), 0)
+
+
+class DateTest(unittest.TestCase):
+
+    def test_conversion(self):
+        self.assertEqual(kmyimport.archive.to_iso_date("05 01 2017"),
+                         "2017-01-05")
+        self.assertEqual(kmyimport.archive.from_iso_date("2017-01-05"),
+                         "05 01 2017")
+
+    def test_invalid_iso_date(self):
+        with self.assertRaises(ValueError):
+            kmyimport.archive.from_iso_date("05.01.2017")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Tests of kmyimport.fanout."""
+
+import os
+import tempfile
+import unittest
+
+import kmyimport
+import kmyimport.fanout
+
+
+def make_row(date, payee="payee"):
+    row = [""] * kmyimport.ROW_LENGTH
+    row[kmyimport.Columns.DATE] = date
+    row[kmyimport.Columns.PAYEE] = payee
+    return row
+
+
+def read_lines(file_name):
+    with open(file_name, "rt", encoding='utf-16') as handle:
+        return handle.read().splitlines()
+
+
+class FanOutWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+
+    def path(self, name):
+        return os.path.join(self._dir.name, name)
+
+    def test_reopened_files_get_single_header(self):
+        names = [self.path(n) for n in ("a.csv", "b.csv", "c.csv")]
+        with kmyimport.fanout.FanOutWriter(["H"], max_open=2) as writer:
+            for index in range(9):
+                writer.writerow(names[index % 3], [str(index)])
+                self.assertLessEqual(len(writer._pool), 2)
+            self.assertEqual(writer.file_names, sorted(names))
+        for offset, name in enumerate(names):
+            self.assertEqual(read_lines(name),
+                             ['"H"'] + ['"{}"'.format(i)
+                                        for i in range(offset, 9, 3)])
+            with open(name, "rb") as handle:
+                # a single byte order mark
+                self.assertEqual(handle.read().count(b"\xff\xfe"), 1)
+
+    def test_max_open_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            kmyimport.fanout.FanOutWriter(["H"], max_open=0)
+
+    def test_write_split(self):
+        rows = [kmyimport.get_output_header(),
+                make_row("01 01 2017"), make_row("02 02 2017"),
+                make_row("03 01 2017")]
+        names = kmyimport.fanout.write_split(
+            rows, self.path("export.csv"), "month", max_open=1)
+        self.assertEqual(names, [self.path("export.2017-01.kmy.csv"),
+                                 self.path("export.2017-02.kmy.csv")])
+        self.assertEqual(len(read_lines(names[0])), 3)
+
+
+class GetPeriodTest(unittest.TestCase):
+
+    def test_periods(self):
+        row = make_row("05 03 2017")
+        self.assertEqual(kmyimport.fanout.get_period(row, "month"),
+                         "2017-03")
+        self.assertEqual(kmyimport.fanout.get_period(row, "year"), "2017")
+
+    def test_invalid_date(self):
+        for date in ("", "05.03.2017", "05 03"):
+            with self.assertRaisesRegex(ValueError, "invalid date"):
+                kmyimport.fanout.get_period(make_row(date), "month")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Tests of kmyimport.profiling."""
+
+import csv
+import io
+import unittest
+
+import kmyimport
+from kmyimport.formats import air, fio
+import kmyimport.profiling
+
+from test_resilient import make_export
+
+
+def convert(content):
+    rows = csv.reader(io.StringIO(content), delimiter=fio.INDELIM)
+    kmyimport.skip_header(rows, verbose=False)
+    return list(fio.transform(rows))
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_counters_per_column(self):
+        content = make_export(4)
+        with kmyimport.profiling.Profiler() as profiler:
+            profiler.start(fio)
+            output = convert(content)
+        self.assertEqual(output, convert(content))
+        columns = {profiler.get_column_name("fio", column): calls
+                   for column, calls, _, _ in profiler.get_columns("fio")}
+        self.assertNotIn("None", columns)
+        # payee is empty in all the rows, its fallback is sanitized as well
+        self.assertEqual(columns["Název protiúčtu"], 8)
+        for name in ("ID pohybu", "Datum", "Objem", "Poznámka", "BIC"):
+            self.assertEqual(columns[name], 4, name)
+        self.assertEqual([stage for stage, _ in profiler.get_stages("fio")],
+                         list(kmyimport.profiling.STAGES))
+
+    def test_skipped_fallback(self):
+        column_names = ["c{}".format(index) for index in range(33)]
+        row = [""] * 33
+        row[air.AirColumns.DATE.value] = "01/02/2017"
+        row[air.AirColumns.AMOUNT.value] = "-100,00"
+        row[air.AirColumns.REFNUM.value] = "R1"
+        # the fee is not merged as the amount is present, payee account name
+        # is merged as the payee is empty; both are empty strings
+        with kmyimport.profiling.Profiler() as profiler:
+            profiler.start(air)
+            air.transform_row(column_names, row)
+        calls = {column: count
+                 for column, count, _, _ in profiler.get_columns("air")}
+        self.assertEqual(calls[air.AirColumns.FEE.value], 1)
+        self.assertEqual(calls[air.AirColumns.PAYEEACCOUNTNAME.value], 2)
+        self.assertNotIn(None, calls)
+
+    def test_stop_restores_functions(self):
+        originals = (kmyimport.data_sanitize, kmyimport.get_memo_column,
+                     fio.transform_row, fio.merge_columns, fio.transform_date)
+        profiler = kmyimport.profiling.Profiler()
+        profiler.start(fio)
+        self.assertIsNot(fio.transform_row, originals[2])
+        profiler.stop()
+        self.assertEqual((kmyimport.data_sanitize, kmyimport.get_memo_column,
+                          fio.transform_row, fio.merge_columns,
+                          fio.transform_date), originals)
+
+
+if __name__ == '__main__':
+    unittest.main()
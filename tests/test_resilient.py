@@ -0,0 +1,175 @@
+"""Tests of kmyimport.resilient."""
+
+import csv
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import kmyimport
+import kmyimport.archive
+from kmyimport.formats import fio
+import kmyimport.resilient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# converts the export archiving its rows, the process is killed at a row
+KILLED_RUN = """
+import os, sys
+import kmyimport.archive
+from kmyimport.formats import fio
+import test_resilient
+
+calls = []
+
+def killed(column_names, row):
+    calls.append(row)
+    if len(calls) == int(sys.argv[3]):
+        os._exit(1)
+    return fio.transform_row(column_names, row)
+
+archive = kmyimport.archive.Archive(sys.argv[2], batch_size=5)
+test_resilient.convert(sys.argv[1], killed, archive=archive)
+"""
+
+HEADER = (
+    '"accountId";"2100000000"\n'
+    '"currency";"CZK"\n'
+    '\n'
+    '"ID pohybu";"Datum";"Objem";"Měna";"Protiúčet";"Název protiúčtu";'
+    '"Kód banky";"Název banky";"KS";"VS";"SS";"Poznámka";'
+    '"Zpráva pro příjemce";"Typ";"Provedl";"Upřesnění";"Komentář";"BIC";'
+    '"ID pokynu"\n')
+ROW = ('"{0}";"{1:02d}/01/2017";"{0},00";"CZK";"";"Shop {0}";"";"";"";"";'
+       '"";"{2}";"";"";"";"";"";"";""\n')
+# line number of the first data row
+FIRST_LINE = HEADER.count("\n") + 1
+
+
+def make_export(count, bad=(), multiline=()):
+    """Return Fio export with the given number of rows.
+
+    Rows with index in bad are truncated, rows in multiline have a note
+    spanning two lines.
+    """
+    lines = [HEADER]
+    for index in range(count):
+        note = "first\nsecond" if index in multiline else "note"
+        row = ROW.format(index + 1, index % 28 + 1, note)
+        if index in bad:
+            row = row[:row.index(";")] + "\n"
+        lines.append(row)
+    return "".join(lines)
+
+
+class Interrupt(Exception):
+    """Stands for the conversion being killed."""
+
+
+def convert(input_name, transform_row=fio.transform_row, checkpoint_every=3,
+            archive=None):
+    return kmyimport.resilient.process_file(
+        open(input_name, "rb"), transform_row, fio.INDELIM, encoding='utf-8',
+        preamble=lambda rows: kmyimport.skip_header(rows, verbose=False),
+        checkpoint_every=checkpoint_every, archive=archive, source=fio.NAME)
+
+
+def load_fio2kmy():
+    spec = importlib.util.spec_from_file_location(
+        "fio2kmy", os.path.join(ROOT, "bin", "fio2kmy.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_bytes(file_name):
+    with open(file_name, "rb") as handle:
+        return handle.read()
+
+
+class ResilientTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+
+    def write_input(self, name, content):
+        directory = os.path.join(self._dir.name, name)
+        os.mkdir(directory)
+        file_name = os.path.join(directory, "export.csv")
+        with open(file_name, "wt", encoding='utf-8', newline='') as handle:
+            handle.write(content)
+        return file_name
+
+    def test_resume_gives_identical_output(self):
+        content = make_export(20, bad={4, 12}, multiline={2, 9, 15})
+        clean = self.write_input("clean", content)
+        resumed = self.write_input("resumed", content)
+        self.assertEqual(convert(clean), 20)
+
+        calls = []
+
+        def interrupted(column_names, row):
+            calls.append(row)
+            if len(calls) == 11:
+                raise Interrupt()
+            return fio.transform_row(column_names, row)
+
+        with self.assertRaises(Interrupt):
+            convert(resumed, interrupted)
+        output = kmyimport.get_output_file_name(resumed)
+        checkpoint = kmyimport.resilient.get_checkpoint_file_name(output)
+        self.assertTrue(os.path.exists(checkpoint))
+
+        self.assertEqual(convert(resumed), 20)
+        self.assertFalse(os.path.exists(checkpoint))
+        for tag in (".kmy", kmyimport.resilient.QUARANTINE_TAG):
+            self.assertEqual(
+                read_bytes(kmyimport.get_output_file_name(resumed, tag)),
+                read_bytes(kmyimport.get_output_file_name(clean, tag)))
+
+    def test_quarantine_line_numbers_of_multiline_rows(self):
+        input_name = self.write_input(
+            "lines", make_export(6, bad={1, 4}, multiline={0, 2, 3}))
+        convert(input_name)
+        quarantine = kmyimport.get_output_file_name(
+            input_name, kmyimport.resilient.QUARANTINE_TAG)
+        with open(quarantine, "rt", encoding='utf-8', newline='') as handle:
+            rows = list(csv.reader(handle, delimiter=";"))
+        # row 0 spans two lines, rows 2 and 3 as well
+        self.assertEqual([row[0] for row in rows[1:]],
+                         [str(FIRST_LINE + 2), str(FIRST_LINE + 7)])
+        self.assertTrue(rows[1][1].startswith("IndexError"))
+        self.assertEqual(rows[1][2], "2")
+
+    def test_resume_after_kill_archives_all_rows(self):
+        input_name = self.write_input("killed", make_export(10))
+        archive_name = os.path.join(self._dir.name, "archive.db")
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            p for p in [ROOT, os.path.join(ROOT, "tests"),
+                        env.get("PYTHONPATH")] if p)
+        result = subprocess.run(
+            [sys.executable, "-c", KILLED_RUN, input_name, archive_name,
+             "8"], env=env)
+        self.assertEqual(result.returncode, 1)
+        with kmyimport.archive.Archive(archive_name, batch_size=5) as archive:
+            self.assertEqual(convert(input_name, archive=archive), 10)
+            self.assertEqual([row[:2] for row in archive.accounts()],
+                             [("2100000000", 10)])
+
+    def test_archived_under_statement_account_in_both_modes(self):
+        input_name = self.write_input("archive", make_export(5))
+        with kmyimport.archive.Archive(":memory:") as archive:
+            convert(input_name, archive=archive)
+            with open(input_name, "rt", encoding='utf-8',
+                      newline='') as handle:
+                load_fio2kmy().process_file(handle, verbose=False,
+                                            archive=archive)
+            self.assertEqual([row[:2] for row in archive.accounts()],
+                             [("2100000000", 5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Tests of the roklen2kmy.py script."""
+
+import csv
+import importlib.util
+import io
+import os
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRANSACTIONS = """\
+"Status";"Date";"Ref";"Sold";"SoldCur";"Ratio";"Bought";"BoughtCur";\
+"Payee";"Amount";"VS";"Type"
+"done";"2017/02/10";"X1";"100";"CZK";"0.037";"3.7";"EUR";"bank";"";"";"fx"
+"done";"2017/01/05";"X2";"50";"EUR";"27";"1350";"CZK";"me";"";"";"fx"
+"done";"2017/01/03";"X3";"10";"CZK";"0.037";"0.37";"EUR";"me";"";"";"fx"
+"""
+PAYMENTS = """\
+"Date";"Amount";"Currency";"Payee";"Ref";"TRef"
+"02.01.2017";"3.7";"EUR";"Someone";"P1";"X1"
+"""
+
+
+def load_script():
+    spec = importlib.util.spec_from_file_location(
+        "roklen2kmy", os.path.join(ROOT, "bin", "roklen2kmy.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def reader(text):
+    return csv.reader(io.StringIO(text), delimiter=";", quotechar='"')
+
+
+class ProcessFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.script = load_script()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        cwd = os.getcwd()
+        os.chdir(directory.name)
+        self.addCleanup(os.chdir, cwd)
+
+    def test_files_named_after_earliest_date(self):
+        names = self.script.process_files(reader(TRANSACTIONS),
+                                          reader(PAYMENTS))
+        self.assertEqual(names, ["RoklenFX-2017-01-02-eur.kmy.csv",
+                                 "RoklenFX-2017-01-03-czk.kmy.csv"])
+        self.assertEqual(sorted(os.listdir(".")), names)
+
+    def test_split_by_month(self):
+        names = self.script.process_files(
+            reader(TRANSACTIONS), reader(PAYMENTS), split_by="month")
+        self.assertEqual(names, ["RoklenFX-2017-01-czk.kmy.csv",
+                                 "RoklenFX-2017-01-eur.kmy.csv",
+                                 "RoklenFX-2017-02-czk.kmy.csv",
+                                 "RoklenFX-2017-02-eur.kmy.csv"])
+
+
+if __name__ == '__main__':
+    unittest.main()
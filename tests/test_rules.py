@@ -0,0 +1,97 @@
+"""Tests of kmyimport.rules."""
+
+import io
+import os
+import tempfile
+import unittest
+
+import kmyimport
+import kmyimport.rules
+
+RULES = """\
+# pattern;payee;category;tags
+coffee;Coffee Shop;Food:Coffee;morning drink
+(?i:tesco|albert);Groceries;Food
+shop\\\\1;Literal;Misc
+x[(?i)]y;Bracket;Misc
+"""
+
+
+def parse(text):
+    return kmyimport.rules.parse_rules(io.StringIO(text))
+
+
+def make_row(payee, memo=""):
+    row = [""] * kmyimport.ROW_LENGTH
+    row[kmyimport.Columns.PAYEE] = payee
+    row[kmyimport.Columns.MEMO] = memo
+    return row
+
+
+class ParseRulesTest(unittest.TestCase):
+
+    def test_valid_rules(self):
+        rules = parse(RULES)
+        self.assertEqual([rule.payee for rule in rules],
+                         ["Coffee Shop", "Groceries", "Literal", "Bracket"])
+        self.assertEqual(rules[0].tags, ("morning", "drink"))
+
+    def assert_rejected(self, pattern, message):
+        with self.assertRaisesRegex(ValueError, "on line 2: " + message):
+            parse("ok;Ok\n{};Bad\n".format(pattern))
+
+    def test_backreference_is_rejected(self):
+        self.assert_rejected(r"(a)\1", "backreferences")
+
+    def test_named_group_is_rejected(self):
+        self.assert_rejected(r"(?P<n>a)", "named groups")
+
+    def test_global_flags_are_rejected(self):
+        self.assert_rejected("(?i)shop", "inline flags")
+        # newer Python versions reject flags not at the start on their own
+        self.assert_rejected("shop(?s)", "(inline|global) flags")
+
+    def test_conditional_reference_is_rejected(self):
+        self.assert_rejected("(a)?(?(1)b|c)", "conditional")
+
+    def test_invalid_pattern_is_rejected(self):
+        self.assert_rejected("(a", "missing")
+
+
+class RuleSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ruleset = kmyimport.rules.RuleSet(parse(RULES))
+
+    def test_match_prefers_earliest_position(self):
+        self.assertEqual(self.ruleset.match("TESCO coffee").payee,
+                         "Groceries")
+        self.assertEqual(self.ruleset.match("coffee at Tesco").payee,
+                         "Coffee Shop")
+        self.assertIsNone(self.ruleset.match("bakery"))
+
+    def test_apply(self):
+        row = self.ruleset.apply(make_row("Morning COFFEE", "note"))
+        self.assertEqual(row[kmyimport.Columns.PAYEE], "Coffee Shop")
+        self.assertEqual(row[kmyimport.Columns.MEMO],
+                         "note\nTags - morning drink")
+        self.assertEqual(row[-1], "Food:Coffee")
+        row = self.ruleset.apply(make_row("bakery"))
+        self.assertEqual(row[kmyimport.Columns.PAYEE], "bakery")
+        self.assertEqual(row[-1], "")
+
+    def test_load_uses_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "rules.csv")
+            with open(file_name, "wt", encoding='utf-8') as handle:
+                handle.write(RULES)
+            first = kmyimport.rules.load(file_name)
+            self.assertTrue(os.path.exists(
+                kmyimport.rules.get_cache_file_name(file_name)))
+            second = kmyimport.rules.load(file_name)
+            self.assertEqual(second.source, first.source)
+            self.assertEqual(second.match("albert").payee, "Groceries")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""Tests of statement header parsing and of the balance check."""
+
+import contextlib
+import csv
+import datetime
+from decimal import Decimal
+import io
+import os
+import tempfile
+import unittest
+
+import kmyimport
+
+from test_resilient import load_fio2kmy
+
+PREAMBLE = (
+    '"accountId";"2100000000"\n'
+    '"bankId";"2010"\n'
+    '"currency";"CZK"\n'
+    '"openingBalance";"{opening}"\n'
+    '"closingBalance";"{closing}"\n'
+    '"dateStart";"01.01.2017"\n'
+    '"dateEnd";"31.01.2017"\n'
+    '\n')
+COLUMNS = (
+    '"ID pohybu";"Datum";"Objem";"Měna";"Protiúčet";"Název protiúčtu";'
+    '"Kód banky";"Název banky";"KS";"VS";"SS";"Poznámka";'
+    '"Zpráva pro příjemce";"Typ";"Provedl";"Upřesnění";"Komentář";"BIC";'
+    '"ID pokynu"\n')
+ROW = ('"{0}";"0{0}/01/2017";"{1}";"CZK";"";"Shop";"";"";"";"";"";"";"";"";'
+       '"";"";"";"";""\n')
+AMOUNTS = ["100,00", "-30,50", "1 000,00"]
+
+
+def make_export(opening="1000,00", closing="2069,50", amounts=AMOUNTS):
+    return (PREAMBLE.format(opening=opening, closing=closing) + COLUMNS +
+            "".join(ROW.format(index + 1, amount)
+                    for index, amount in enumerate(amounts)))
+
+
+def read_info(content, verbose=False):
+    rows = csv.reader(io.StringIO(content), delimiter=";")
+    return kmyimport.skip_header(rows, verbose), rows
+
+
+def check_balance(content):
+    """Return the balance check after streaming the export through it."""
+    from kmyimport.formats import fio
+    info, rows = read_info(content)
+    balance = kmyimport.BalanceCheck.from_statement(info)
+    for _ in balance.watch(fio.transform(rows)):
+        pass
+    return balance
+
+
+class StatementInfoTest(unittest.TestCase):
+
+    def test_fields(self):
+        info, rows = read_info(make_export())
+        self.assertEqual(info.get("accountId"), "2100000000")
+        self.assertEqual(info.account, "2100000000/2010")
+        self.assertEqual(info.currency, "CZK")
+        self.assertEqual(info.opening_balance, Decimal("1000.00"))
+        self.assertEqual(info.closing_balance, Decimal("2069.50"))
+        self.assertEqual(info.date_start, datetime.date(2017, 1, 1))
+        self.assertEqual(info.date_end, datetime.date(2017, 1, 31))
+        # the column names follow the header
+        self.assertEqual(next(rows)[0], "ID pohybu")
+
+    def test_quiet(self):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            info, _ = read_info(make_export(), verbose=False)
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertEqual(len(info.fields), 7)
+        with contextlib.redirect_stdout(stdout):
+            read_info(make_export(), verbose=True)
+        self.assertIn("2100000000", stdout.getvalue())
+
+    def test_invalid_balance_disables_check(self):
+        for value in ("1 100,00 CZK", "n/a"):
+            info, _ = read_info(make_export(closing=value))
+            self.assertIsNone(info.closing_balance)
+            self.assertFalse(
+                kmyimport.BalanceCheck.from_statement(info).enabled)
+
+    def test_no_header(self):
+        info, _ = read_info(COLUMNS)
+        self.assertFalse(info)
+        self.assertIsNone(info.account)
+        self.assertIsNone(info.opening_balance)
+
+
+class BalanceCheckTest(unittest.TestCase):
+
+    def test_matching_balance(self):
+        balance = check_balance(make_export())
+        self.assertEqual(balance.count, 3)
+        self.assertIsNone(balance.get_error())
+
+    def test_truncated_export(self):
+        balance = check_balance(make_export(amounts=AMOUNTS[:2]))
+        error = balance.get_error()
+        self.assertIn("balance mismatch", error)
+        self.assertIn("difference 1000.00", error)
+        self.assertNotIn("invalid amounts", error)
+
+    def test_invalid_amounts_counted(self):
+        balance = check_balance(make_export(
+            closing="2100,00", amounts=AMOUNTS + ["ten", "1,2,3"]))
+        self.assertEqual(balance.count, 5)
+        self.assertEqual(balance.invalid, 2)
+        self.assertIn("2 invalid amounts", balance.get_error())
+
+
+class ProcessFileTest(unittest.TestCase):
+
+    def test_invalid_balance_converted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            input_name = os.path.join(directory, "export.csv")
+            with open(input_name, "wt", encoding='utf-8') as handle:
+                handle.write(make_export(closing="n/a"))
+            stderr = io.StringIO()
+            with open(input_name, "rt", encoding='utf-8', newline='') as \
+                    handle, contextlib.redirect_stderr(stderr):
+                load_fio2kmy().process_file(handle, verbose=False)
+            self.assertNotIn("balance", stderr.getvalue())
+            with open(kmyimport.get_output_file_name(input_name), "rt",
+                      encoding='utf-16', newline='') as handle:
+                self.assertEqual(
+                    len(list(csv.reader(handle, delimiter=";"))), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Tests of kmyimport.transactions and of dates in the output rows."""
+
+import datetime
+from decimal import Decimal
+import io
+import unittest
+
+import kmyimport
+from kmyimport.formats import fio, mbdcz
+import kmyimport.transactions
+
+FIO_EXPORT = (
+    '"accountId";"2100000000"\n'
+    '\n'
+    '"ID pohybu";"Datum";"Objem";"Měna";"Protiúčet";"Název protiúčtu";'
+    '"Kód banky";"Název banky";"KS";"VS";"SS";"Poznámka";'
+    '"Zpráva pro příjemce";"Typ";"Provedl";"Upřesnění";"Komentář";"BIC";'
+    '"ID pokynu"\n'
+    '"1";"{}";"-10,50";"CZK";"";"Shop";"";"";"";"";"";"";"";"";"";"";"";"";'
+    '""\n')
+
+
+def make_row(date, amount="1.00"):
+    row = [""] * kmyimport.ROW_LENGTH
+    row[kmyimport.Columns.DATE] = date
+    row[kmyimport.Columns.AMOUNT] = amount
+    return row
+
+
+class NormalizeDateTest(unittest.TestCase):
+
+    def test_separators(self):
+        for value in ("05/01/2017", "05.01.2017", "05 01 2017", "05-01-2017",
+                      "5.1.2017"):
+            self.assertEqual(kmyimport.normalize_date(value), "05 01 2017")
+
+    def test_invalid(self):
+        for value in ("", "2017-01-05", "31/02/2017", "05/13/2017",
+                      "05/01/17", "05/01/2017 10:00"):
+            with self.assertRaisesRegex(ValueError, "invalid date"):
+                kmyimport.normalize_date(value)
+
+    def test_transform_row_rejects_invalid_date(self):
+        row = [""] * 19
+        row[fio.FioColumns.DATE.value] = "2017/01/05"
+        with self.assertRaisesRegex(ValueError, "'2017/01/05'"):
+            fio.transform_row([""] * 19, row)
+
+    def test_transform_row_pads_date(self):
+        row = ["", "1.4.2017", "-120,00", "", "", "", "", ""]
+        self.assertEqual(
+            mbdcz.transform_row([""] * 8, row)[kmyimport.Columns.DATE],
+            "01 04 2017")
+
+
+class TransactionTest(unittest.TestCase):
+
+    def test_iter_transactions(self):
+        source = io.BytesIO(FIO_EXPORT.format("05.01.2017").encode('utf-8'))
+        transactions = list(kmyimport.iter_transactions(
+            source, "fio", encoding='utf-8'))
+        self.assertEqual(len(transactions), 1)
+        self.assertEqual(transactions[0].date, datetime.date(2017, 1, 5))
+        self.assertEqual(transactions[0].amount, Decimal("-10.50"))
+        self.assertFalse(source.closed)
+
+    def test_invalid_date_names_row(self):
+        with self.assertRaisesRegex(ValueError, "row .*'2017 01 05'"):
+            kmyimport.transactions.Transaction.from_row(
+                make_row("2017 01 05"))
+
+    def test_invalid_amount_names_row(self):
+        with self.assertRaisesRegex(ValueError, "row .*'05 01 2017'"):
+            kmyimport.transactions.Transaction.from_row(
+                make_row("05 01 2017", "ten"))
+
+
+if __name__ == '__main__':
+    unittest.main()